@@ -30,17 +30,33 @@
 # Description:  Help a user create a new media server password.
 #
 # ============================================================================ #
-from bcrypt import hashpw
 from getpass import getpass
 
-from dotenv import load_dotenv
 import os
-load_dotenv(".secrets.env")
+
+# NOTE: bcrypt and dotenv are imported lazily, so backing out at the
+#       password prompt doesn't pay for loading them.
+_is_env_loaded = False
+
+# 30 most common passwords, rejected outright
+_COMMON_PASSWORDS = frozenset({
+    "123456", "password", "123456789", "12345", "12345678", "qwerty",
+    "1234567", "111111", "1234567890", "123123", "abc123", "1234",
+    "password1", "iloveyou", "1q2w3e4r", "000000", "qwerty123", "zaq12wsx",
+    "dragon", "sunshine", "princess", "letmein", "654321", "monkey",
+    "27653", "1qaz2wsx", "123321", "qwertyuiop", "superman", "asdfghjkl"
+})
+
+# bcrypt silently ignores everything past the first 72 bytes
+# NOTE: We can't prehash or use a random salt here, the client re-derives
+#       this exact hash from the pepper served at /pepper.
+_BCRYPT_MAX_BYTES = 72
 
 
 def is_password_secure(password: str) -> str | None:
     """Check to see if the password is secure enough.
-    Currently that means it is at least 8 characters long.
+    Currently that means it is at least 8 characters long,
+    and short enough that bcrypt doesn't truncate it.
 
     Args:
         password (str): The password to check.
@@ -48,18 +64,12 @@ def is_password_secure(password: str) -> str | None:
     Returns:
         bool: True if the password is secure, false if not.
     """
-    common_passwords_30 = [
-        "123456", "password", "123456789", "12345", "12345678", "qwerty",
-        "1234567", "111111", "1234567890", "123123", "abc123", "1234",
-        "password1", "iloveyou", "1q2w3e4r", "000000", "qwerty123", "zaq12wsx",
-        "dragon", "sunshine", "princess", "letmein", "654321", "monkey",
-        "27653", "1qaz2wsx", "123321", "qwertyuiop", "superman", "asdfghjkl"
-    ]
-
     if len(password) < 8:
         return "Password must be at least 8 characters long."
-    elif password in common_passwords_30:
+    elif password in _COMMON_PASSWORDS:
         return "That password is not allowed. Too easy to guess."
+    elif _BCRYPT_MAX_BYTES < len(password.encode("utf-8")):
+        return f"Password must be at most {_BCRYPT_MAX_BYTES} bytes long."
 
     return None
 
@@ -70,6 +80,12 @@ def get_pepper():
     Returns:
         str|None: The pepper.
     """
+    global _is_env_loaded
+    if not _is_env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(".secrets.env")
+        _is_env_loaded = True
+
     return os.getenv('PASSWORD_PEPPER')
 
 
@@ -106,13 +122,22 @@ def create_password(pw_file: str):
             return
 
         # Hash the password
+        from bcrypt import hashpw
         password = password.encode("utf-8")
         pepper = pepper.encode("utf-8")
         hashed = hashpw(password, pepper)
 
         # Store the password
-        with open(pw_file, "wb") as f:
-            f.write(hashed)
+        # NOTE: Written to a temp file and swapped in, so a crash midway
+        #       can't leave a truncated hash that locks everyone out.
+        pw_file_tmp = pw_file + ".tmp"
+        fd = os.open(pw_file_tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, hashed)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(pw_file_tmp, pw_file)
 
         print("Password successfully created.")
         return
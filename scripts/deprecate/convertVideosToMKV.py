@@ -18,20 +18,54 @@ import os
 SUPPORTED_VID_EXT = ".mkv"
 SUPPORTED_SUB_EXT = ".srt"
 
+# ==========
+# Traversal
+# ==========
+
+def _iter_dirs(root: str):
+    """Yield (directory, files) for every directory under root,
+    where files is the list of DirEntry files directly inside it.
+    Uses os.scandir so the file/dir check comes from the cached 
+    readdir data rather than another stat per entry.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        files = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    files.append(entry)
+        yield directory, files
+
 # =========
 # Checkers
 # =========
 
-def is_non_supported_type(filename : str):
+def is_non_supported_type(ext : str):
     """Return true if the file is a type we need to convert.
     Currently that is anything not an MKV
+
+    Input
+    -----
+    ext: str
+        Lowercase file extension, including the dot.
     """
-    return not filename.lower().endswith(SUPPORTED_VID_EXT)
+    return ext != SUPPORTED_VID_EXT
 
-def is_subtitle_extracted(root: str, filename: str):
+def is_subtitle_extracted(files_set: set, filename: str):
     """Check if the subtitle has been extracted yet.
     It will be in the same folder with the same name, 
     but with the SUPPORTED_SUB_EXT
+
+    Input
+    -----
+    files_set: set
+        Names of the files in the video's folder.
+    filename: str
+        Name of the video file. (Extension included)
     
     Raises
     ------
@@ -41,7 +75,7 @@ def is_subtitle_extracted(root: str, filename: str):
     """
     if filename.lower().endswith(SUPPORTED_VID_EXT):
         filename_sub = filename[:-len(SUPPORTED_VID_EXT)] + SUPPORTED_SUB_EXT
-        return os.path.exists(os.path.join(root, filename_sub))
+        return filename_sub in files_set
     else:
         raise ValueError(f"{filename} is not a supported video type. "
             f"Expected a(n) {SUPPORTED_VID_EXT}")
@@ -82,10 +116,15 @@ def convert_avi_to_mkv(root: str, filename: str, filename_new: str):
     """
     raise NotImplementedError(f"No support yet for filetype: avi")
 
-def converter_dispatch(root: str, filename: str):
+def converter_dispatch(root: str, filename: str, ext: str):
     """Dispatch function for routing a given file 
     to it's converter method
 
+    Input
+    -----
+    ext: str
+        Lowercase file extension of filename, including the dot.
+
     Returns
     -------
     filename_new : str
@@ -98,12 +137,10 @@ def converter_dispatch(root: str, filename: str):
 
     ext_ignore = [".meta", ".srt"]
 
-    # Get the new filename + current extension
-    filename_noext, ext = os.path.splitext(filename)
-    filename_new = filename_noext + SUPPORTED_VID_EXT
-    ext = ext.lower()
+    # Get the new filename
+    filename_new = filename[:len(filename)-len(ext)] + SUPPORTED_VID_EXT
 
-    if ext in dispatch_map.keys():
+    if ext in dispatch_map:
         dispatch_map[ext](root, filename, filename_new)
     elif ext not in ext_ignore:
         path = os.path.join(root, filename)
@@ -127,16 +164,25 @@ if __name__ == "__main__":
     
     DIR_VIDEOS = "videos/"
     
-    for root, dirnames, filenames in os.walk(DIR_VIDEOS):
-        for filename in filenames:
+    for root, files in _iter_dirs(DIR_VIDEOS):
+
+        # The listing doubles as our subtitle lookup, no stat per video
+        files_set = {entry.name for entry in files}
+
+        for entry in files:
+            filename = entry.name
+
+            # Lowercase the extension once, both checks need it
+            i_ext = filename.rfind(".")
+            ext = filename[i_ext:].lower() if i_ext != -1 else ""
 
             try:
                 # If we don't support this type convert it
-                if is_non_supported_type(filename):
-                    filename = converter_dispatch(root, filename)
+                if is_non_supported_type(ext):
+                    filename = converter_dispatch(root, filename, ext)
 
                 # Check if we have the subtitels extracted yet
-                if is_subtitle_extracted(root, filename):
+                if is_subtitle_extracted(files_set, filename):
                     sub_extracter(root, filename)
             
             except NotImplementedError as e:
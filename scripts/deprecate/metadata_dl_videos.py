@@ -36,14 +36,49 @@
 import os
 import shutil
 import re
-import configparser
+import requests
 
-from libs.web_scraping import check_for_config_issues, load_meta_data, \
-    determine_missing_required_params, store_meta_data, \
-    get_top_url, get_soup, get_image, fmt_check
+from libs.web_scraping import load_config, check_for_config_issues, \
+    load_meta_data, determine_missing_required_params, store_meta_data, \
+    get_top_url, get_soup, get_soup_local, get_image, fmt_check
 
+# Characters that shouldnt be in a filename
+_FN_STRIP = str.maketrans("", "", "?/\\")
 
-def extract_anidb(title: str, thumbnail_addr: str):
+# Page urls we trust, the matching group names the site
+_URL_RE = re.compile(
+    r"^https://(?:(?P<wikipedia>en\.wikipedia\.org/wiki/)|(?P<anidb>anidb\.net/anime/\d+))")
+
+# Everything extract_anidb reads off the page, so it's found in one pass
+_ANIDB_SELECTOR = ", ".join([
+    'label[itemprop="alternateName"]',
+    'table.staff a',
+    'tr.tags span[itemprop="genre"]',
+    'span[itemprop="numberOfEpisodes"]',
+    'span[itemprop="startDate"]',
+    'span[itemprop="endDate"]',
+    'div[itemprop="description"]',
+    'img[itemprop="image"]',
+])
+
+# Shared across every title so connections to the same host are reused
+_SESSION = requests.Session()
+
+# Thumbnails are small, one or two of these covers most of them
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+
+def download_image(img_url: str, addr_store: str):
+    """Stream an image to disk over the shared session.
+    Raises requests.HTTPError if the server refuses us.
+    """
+    with _SESSION.get(img_url, stream=True, timeout=10) as r:
+        r.raise_for_status()
+        with open(addr_store, "wb", buffering=_DOWNLOAD_CHUNK_SIZE) as fp:
+            shutil.copyfileobj(r.raw, fp, _DOWNLOAD_CHUNK_SIZE)
+
+
+def extract_anidb(title: str, titleClean: str, thumbnail_addr: str):
     """
         Extract the information from an aniDB webpage. 
         Takes the url of the page as an arguement.
@@ -51,111 +86,117 @@ def extract_anidb(title: str, thumbnail_addr: str):
 
     metaData = {}
 
-    for url in googlesearch.search(title + " anidb", num=1, stop=1, pause=1):
-
-        if re.match(r"https:\/\/anidb\.net\/anime\/\d+", url):
-
-            print(f"Grabbing data from AniDB: '{url}'")
-            # soup = getSoup(url)
-            soup = None
-            if soup:
-                metaData["visited_AniDB"] = True
-
-                # Extract what we need
-                e0 = soup.find_all("label", {"itemprop": "alternateName"})
-                if e0 and 1 < len(e0):
-                    txt = e0[1].get_text()
-                    if fmtCheck(txt, 'title-jp'):
-                        metaData['title-jp'] = txt
-
-                e0 = soup.find("table", {"class": "staff"})
-                if e0:
-                    e1 = e0.find_all("a")
-                    if e1 and 0 < len(e1):
-                        txt = e1[-1].get_text()
-                        if fmtCheck(txt, 'studio'):
-                            metaData['staff'] = txt
-
-                e0 = soup.find("tr", {"class": "tags"})
-                if e0:
-                    e1 = e0.find_all("span", {"itemprop": "genre"})
-                    if e1:
-                        txt = ", ".join([span.get_text() for span in e1])
-                        if fmtCheck(txt, 'tags'):
-                            metaData['tags'] = txt
-
-                e0 = soup.find("span", {"itemprop": "numberOfEpisodes"})
-                if e0:
-                    txt = e0.get_text()
-                    if fmtCheck(txt, 'numberOfEpisodes'):
-                        metaData['numEpisodes'] = txt
-
-                e0 = soup.find("span", {"itemprop": "startDate"})
-                if e0:
-                    startDate = e0.get_text()
-                    if startDate != "?":
-                        if fmtCheck(startDate, 'date'):
-                            [startDay, startMonth,
-                                startYear] = startDate.split(".")
-                            metaData['dayStart'] = startDay
-                            metaData['monthStart'] = startMonth
-                            metaData['yearStart'] = startYear
-
-                e0 = soup.find("span", {"itemprop": "endDate"})
-                if e0:
-                    endDate = e0.get_text()
-                    if endDate != "?":
-                        if fmtCheck(endDate, 'date'):
-                            [endDay, endMonth, endYear] = endDate.split(".")
-                            metaData['dayEnd'] = endDay
-                            metaData['monthEnd'] = endMonth
-                            metaData['yearEnd'] = endYear
-
-                e0 = soup.find("div", {"itemprop": "description"})
-                if e0:
-                    # NOTE: We replace newlines with --- since its going in an ini file
-                    txt = e0.get_text().replace("\n", "---")
-                    if fmtCheck(txt, 'description'):
-                        metaData['description'] = txt
-
-                # Cache the image for thumbnails
-                e0 = soup.find("img", {"itemprop": "image"})
-                if e0:
-                    icon_url = e0['src']
-
-                    # Cache the data
-                    if icon_url:
-                        local_cache_addr = DATA_DIR+THUMBNAIL_CACHE_VIDEOS
-                        if not os.path.exists(local_cache_addr):
-                            os.makedirs(local_cache_addr)
-
-                        # Remove certain characters that shouldnt be in a filename
-                        titleClean = re.sub(title, r"[?\/\\]", "")
-
-                        try:
-                            urlretrieve(
-                                icon_url, local_cache_addr+titleClean+".png")
-
-                            # Save the location of the icon
-                            metaData['iconAddr'] = THUMBNAIL_CACHE_VIDEOS + \
-                                titleClean+".png"
-
-                        except HTTPError:
-                            print(
-                                f"HTTP connection was denied to '{icon_url}'.")
-                        except:
-                            print(f"Unknown Error in accessing '{icon_url}'.")
-
-            else:
-                print("\tERROR! Failed to access page. No data extracted.")
+    url = get_top_url(title + " anidb")
+
+    url_match = _URL_RE.match(url)
+    if url_match and url_match.lastgroup == "anidb":
+
+        print(f"Grabbing data from AniDB: '{url}'")
+        # soup = getSoup(url)
+        soup = None
+        if soup:
+            metaData["visited_AniDB"] = True
+
+            # Grab every node we care about in a single pass over the page
+            alternate_names = []
+            staff_links = []
+            genres = []
+            nodes = {}
+            for node in soup.select(_ANIDB_SELECTOR):
+                if node.name == "label":
+                    alternate_names.append(node)
+                elif node.name == "a":
+                    staff_links.append(node)
+                elif node.get("itemprop") == "genre":
+                    genres.append(node)
+                else:
+                    nodes.setdefault(node.get("itemprop"), node)
+
+            # Extract what we need
+            if 1 < len(alternate_names):
+                txt = alternate_names[1].get_text()
+                if fmt_check(txt, 'title-jp'):
+                    metaData['title-jp'] = txt
+
+            if staff_links:
+                txt = staff_links[-1].get_text()
+                if fmt_check(txt, 'studio'):
+                    metaData['staff'] = txt
+
+            if genres:
+                txt = ", ".join([span.get_text() for span in genres])
+                if fmt_check(txt, 'tags'):
+                    metaData['tags'] = txt
+
+            e0 = nodes.get("numberOfEpisodes")
+            if e0:
+                txt = e0.get_text()
+                if fmt_check(txt, 'numberOfEpisodes'):
+                    metaData['numEpisodes'] = txt
+
+            e0 = nodes.get("startDate")
+            if e0:
+                startDate = e0.get_text()
+                if startDate != "?":
+                    if fmt_check(startDate, 'date'):
+                        [startDay, startMonth,
+                            startYear] = startDate.split(".")
+                        metaData['dayStart'] = startDay
+                        metaData['monthStart'] = startMonth
+                        metaData['yearStart'] = startYear
+
+            e0 = nodes.get("endDate")
+            if e0:
+                endDate = e0.get_text()
+                if endDate != "?":
+                    if fmt_check(endDate, 'date'):
+                        [endDay, endMonth, endYear] = endDate.split(".")
+                        metaData['dayEnd'] = endDay
+                        metaData['monthEnd'] = endMonth
+                        metaData['yearEnd'] = endYear
+
+            e0 = nodes.get("description")
+            if e0:
+                # NOTE: We replace newlines with --- since its going in an ini file
+                txt = e0.get_text().replace("\n", "---")
+                if fmt_check(txt, 'description'):
+                    metaData['description'] = txt
+
+            # Cache the image for thumbnails
+            e0 = nodes.get("image")
+            if e0:
+                icon_url = e0['src']
+
+                # Cache the data
+                if icon_url:
+                    local_cache_addr = DATA_DIR+THUMBNAIL_CACHE_VIDEOS
+                    if not os.path.exists(local_cache_addr):
+                        os.makedirs(local_cache_addr)
+
+                    try:
+                        download_image(
+                            icon_url, local_cache_addr+titleClean+".png")
+
+                        # Save the location of the icon
+                        metaData['iconAddr'] = THUMBNAIL_CACHE_VIDEOS + \
+                            titleClean+".png"
+
+                    except requests.HTTPError:
+                        print(
+                            f"HTTP connection was denied to '{icon_url}'.")
+                    except:
+                        print(f"Unknown Error in accessing '{icon_url}'.")
+
         else:
-            print(f"\tWarning. Unsure about anidb link: '{url}'. Skipping.")
+            print("\tERROR! Failed to access page. No data extracted.")
+    else:
+        print(f"\tWarning. Unsure about anidb link: '{url}'. Skipping.")
 
     # print(metaData)
     return metaData
 
 
-def extract_wikipedia(title: str, thumbnail_addr: str):
+def extract_wikipedia(title: str, titleClean: str, thumbnail_addr: str):
     """
         Extract the information from an Wikipedia webpage. 
         Takes the url of the page as an arguement.
@@ -184,74 +225,67 @@ def extract_wikipedia(title: str, thumbnail_addr: str):
 
     metaData = {}
 
-    for url in googlesearch.search(title + " wikipedia", num=1, stop=1, pause=1):
-
-        if url.startswith("https://en.wikipedia.org/wiki/"):
-
-            print(f"Grabbing data from Wiki Page: '{url}'")
-            # soup = getSoup(url)
-            soup = getSoupLocal(
-                "local_sites/Léon_ The Professional - Wikipedia.html")
-            if soup:
-                metaData["visited_Wikipedia"] = True
-
-                # Grab the right panel of meta-data
-                e0 = soup.find("table", {"class": "infobox vevent"})
-                if e0:
-                    e1 = e0.find_all("tr")
-                    if e1:
-
-                        # For each row in the data box
-                        for tr in e1:
-                            tr_children = [child for child in tr.children]
-
-                            # See if it is the thumbnail
-                            e_img = tr.find("td", {"class": "infobox-image"})
-                            if e_img:
-                                img = e_img.find("img")
-                                print(img)
-
-                            elif 2 == len(tr_children):
-                                th = tr_children[0]
-                                td = tr_children[1]
-
-                                if th.name == "th" and td.name == "td":
-                                    for head in header_to_key.keys():
-                                        if head in th.string.lower():
-                                            print(tr)
-
-                # Cache the image for thumbnails
-                e0 = soup.find("img", {"itemprop": "image"})
-                if e0:
-                    icon_url = e0['src']
-
-                    # Cache the data
-                    if icon_url:
-                        local_cache_addr = DATA_DIR+THUMBNAIL_CACHE_VIDEOS
-                        if not os.path.exists(local_cache_addr):
-                            os.makedirs(local_cache_addr)
-
-                        # Remove certain characters that shouldnt be in a filename
-                        titleClean = re.sub(title, r"[?\/\\]", "")
-
-                        try:
-                            urlretrieve(
-                                icon_url, local_cache_addr+titleClean+".png")
-
-                            # Save the location of the icon
-                            metaData['iconAddr'] = THUMBNAIL_CACHE_VIDEOS + \
-                                titleClean+".png"
-
-                        except HTTPError:
-                            print(
-                                f"HTTP connection was denied to '{icon_url}'.")
-                        except:
-                            print(f"Unknown Error in accessing '{icon_url}'.")
-
-            else:
-                print("\tERROR! Failed to access page. No data extracted.")
+    url = get_top_url(title + " wikipedia")
+
+    url_match = _URL_RE.match(url)
+    if url_match and url_match.lastgroup == "wikipedia":
+
+        print(f"Grabbing data from Wiki Page: '{url}'")
+        # soup = getSoup(url)
+        soup = get_soup_local(
+            "local_sites/Léon_ The Professional - Wikipedia.html")
+        if soup:
+            metaData["visited_Wikipedia"] = True
+
+            # Grab the right panel of meta-data
+            # For each row in the data box
+            for tr in soup.select("table.infobox.vevent tr"):
+                tr_children = [child for child in tr.children]
+
+                # See if it is the thumbnail
+                e_img = tr.find("td", {"class": "infobox-image"})
+                if e_img:
+                    img = e_img.find("img")
+                    print(img)
+
+                elif 2 == len(tr_children):
+                    th = tr_children[0]
+                    td = tr_children[1]
+
+                    if th.name == "th" and td.name == "td":
+                        for head in header_to_key.keys():
+                            if head in th.string.lower():
+                                print(tr)
+
+            # Cache the image for thumbnails
+            e0 = soup.find("img", {"itemprop": "image"})
+            if e0:
+                icon_url = e0['src']
+
+                # Cache the data
+                if icon_url:
+                    local_cache_addr = DATA_DIR+THUMBNAIL_CACHE_VIDEOS
+                    if not os.path.exists(local_cache_addr):
+                        os.makedirs(local_cache_addr)
+
+                    try:
+                        download_image(
+                            icon_url, local_cache_addr+titleClean+".png")
+
+                        # Save the location of the icon
+                        metaData['iconAddr'] = THUMBNAIL_CACHE_VIDEOS + \
+                            titleClean+".png"
+
+                    except requests.HTTPError:
+                        print(
+                            f"HTTP connection was denied to '{icon_url}'.")
+                    except:
+                        print(f"Unknown Error in accessing '{icon_url}'.")
+
         else:
-            print(f"\tWarning. Unsure about anidb link: '{url}'. Skipping.")
+            print("\tERROR! Failed to access page. No data extracted.")
+    else:
+        print(f"\tWarning. Unsure about anidb link: '{url}'. Skipping.")
 
     # print(metaData)
     return metaData
@@ -264,8 +298,7 @@ def download_missing_video_data():
     """
 
     # Load in the config data
-    config = configparser.ConfigParser()
-    config.read("config.ini")
+    config = load_config("config.ini")
 
     # Ensure that the required parameters are present and
     # defined correctly
@@ -287,6 +320,9 @@ def download_missing_video_data():
     required_metadata = config["webscraping"]["RequiredMetadataVideo"].split(
         ",")
 
+    _SESSION.headers.update(
+        {"User-Agent": config["webscraping"]["UserAgent"]})
+
     # Loop through each Video Folder in the Maga Directory
     # Check each metadata file for the required data
     # For each video that does not have all the required data
@@ -315,10 +351,24 @@ def download_missing_video_data():
             # Title is  always the name of the folder the video is in
             meta_data['title'] = title
 
-            # Read from VideoUpdates if we have not tried that yet
-            if 'visited_videoupdates' not in meta_data.keys() or meta_data["visited_videoupdates"] == False:
-                print("Querying VideoUpdates...")
-                extracted_data = download_video_updates(title, thumbnail_addr)
+            # Remove certain characters that shouldnt be in a filename
+            titleClean = title.translate(_FN_STRIP)
+            thumbnail_addr = config["folders"]["ThumbnailCacheVideo"] + \
+                titleClean + ".png"
+
+            # Read from AniDB if we have not tried that yet
+            if 'visited_AniDB' not in meta_data.keys() or meta_data["visited_AniDB"] == False:
+                print("Querying AniDB...")
+                extracted_data = extract_anidb(
+                    title, titleClean, thumbnail_addr)
+                if extracted_data:
+                    meta_data.update(extracted_data)
+
+            # Read from Wikipedia if we have not tried that yet
+            if 'visited_Wikipedia' not in meta_data.keys() or meta_data["visited_Wikipedia"] == False:
+                print("Querying Wikipedia...")
+                extracted_data = extract_wikipedia(
+                    title, titleClean, thumbnail_addr)
                 if extracted_data:
                     meta_data.update(extracted_data)
 
@@ -20,11 +20,23 @@
 #   | {Folder}
 #     | {Name}.{jpg|png}
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
 import os
+import re
 import subprocess
 
+# PyAV reads the container header in-process, without it we fall back
+# to forking ffmpeg for every file and scraping its output.
+try:
+    import av
+except ImportError:
+    av = None
+
+# What probing a corrupt or unreadable file can raise
+_PROBE_ERRORS = (av.error.FFmpegError, OSError) if av else (OSError,)
+
 
 DOWNLOADS_FOLDER = "./media-dls/"
 MANGA_DLS_FOLDER = DOWNLOADS_FOLDER+"manga/"
@@ -38,6 +50,12 @@ MUSIC_FOLDER = MEDIA_FOLDER+"music/"
 VIDEO_FOLDER = MEDIA_FOLDER+"videos/"
 IMAGE_FOLDER = MEDIA_FOLDER+"images/"
 
+# File types we know how to pull tags from
+_MEDIA_EXTS = frozenset({".mp3", ".flac", ".mkv"})
+
+# One "  key   : value" line from the Metadata block of `ffmpeg -i`
+_FFMPEG_META_RE = re.compile(rb"^[ \t]+(\w[\w\-]*)[ \t]*:[ \t]*(.*)$", re.M)
+
 class FFProbeParseer():
     """Utility class used to extract metadata from a
     data dump from ffprobe."""
@@ -52,33 +70,20 @@ class Encoding(Enum):
 
     @staticmethod
     def to_string(n):
-        if n == Encoding.MP3:
-            return ".mp3"
-        elif n == Encoding.FLAC:
-            return ".flac"
-        elif n == Encoding.WAV:
-            return ".wav"
-        elif n == Encoding.MKV:
-            return ".mkv"
-        elif n == Encoding.MP4:
-            return ".mp4"
-        else:
-            return "<unk>"
+        return _ENCODING_TO_STR.get(n, "<unk>")
 
     @staticmethod
     def from_string(s : str):
-        if s == ".mp3":
-            return Encoding.MP3
-        elif s == ".flac":
-            return Encoding.FLAC
-        elif s == ".wav":
-            return Encoding.WAV
-        elif s == ".mkv":
-            return Encoding.MKV
-        elif s == ".mp4":
-            return Encoding.MP4
-        else:
-            return Encoding.UNK
+        return _STR_TO_ENCODING.get(s, Encoding.UNK)
+
+_ENCODING_TO_STR = {
+    Encoding.MP3: ".mp3",
+    Encoding.FLAC: ".flac",
+    Encoding.WAV: ".wav",
+    Encoding.MKV: ".mkv",
+    Encoding.MP4: ".mp4",
+}
+_STR_TO_ENCODING = {s: n for n, s in _ENCODING_TO_STR.items()}
 
 @dataclass
 class MusicMetaData():
@@ -111,7 +116,21 @@ class MusicMetaData():
     # DATE            : 2016
     # track           : 1
 
-def get_metadata_raw(path : str):
+def _iter_files(root : str):
+    """Yield a DirEntry for every file under root.
+    Uses os.scandir so the file/dir check comes from the cached 
+    readdir data rather than another stat per entry.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    yield entry
+
+def get_metadata_raw(path : str, ext : str):
     """Returns the unfiltered metadata for a 
     provided file.
 
@@ -119,6 +138,8 @@ def get_metadata_raw(path : str):
     ------
     path : str
         Path to the file requested.1
+    ext : str
+        Lowercase extension of that file, including the dot.
 
     Return
     ------
@@ -126,62 +147,116 @@ def get_metadata_raw(path : str):
         Dictionary of key-value pairs for each 
         piece of metadata extracted from the file.
     """
-    _, ext = os.path.splitext(path)
-    ext = ext.lower()
-
     # Metadata from the file
     metadata = {}
-    if ext in [".mp3", ".flac", ".mkv"]:
+    if ext in _MEDIA_EXTS:
+
+        if av:
+            with av.open(path) as container:
+                for key, val in container.metadata.items():
+                    metadata[key.lower()] = val.strip()
+            return metadata
 
         # Use FFMPEG to get the metadata from this file
         output = subprocess.run(
             ["ffmpeg", "-i", path], capture_output=True)
 
-        stdout = str(output.stderr).replace("\\n", "\n")
+        # NOTE: ffmpeg reports on stderr, we leave it as bytes
+        stderr = output.stderr
 
-        # Isolate the part of the string that is just meta data
-        i_beg = stdout.find("Metadata:")
-        i_end = stdout.find("Duration:", i_beg)
-        metadata_substr = stdout[i_beg+len("Metadata:"):i_end]
-        metadata_substr = metadata_substr.strip()
+        # Isolate the part of the output that is just meta data
+        i_beg = stderr.find(b"Metadata:")
+        i_end = stderr.find(b"Duration:", i_beg)
+        metadata_block = stderr[i_beg+len(b"Metadata:"):i_end]
 
         # For each line in the metadata, extract the data
         # Should look like the following:
         #   album   : abc
         #   artist  : 123
-        for line in metadata_substr.split("\n"):
-            pair = line.strip().split(":")
-
-            if 2 <= len(pair):
-                key = pair[0].strip().lower()
-                val = (":".join(pair[1:])).strip()
-                metadata[key] = val
+        for match in _FFMPEG_META_RE.finditer(metadata_block):
+            key = match.group(1).decode().lower()
+            val = match.group(2).decode(errors="replace").strip()
+            metadata[key] = val
 
         return metadata
     else:
         raise RuntimeWarning(f"File \"{path}\" is not a known media file.")
 
-def prune_empty_dirs(path : str):
+def prune_empty_dirs(path : str, is_root : bool = True):
     """Removes all empty directories from a given path."""
-    for root, _, files in os.walk(path, topdown=False):
-        if root != path and 0 == len(files):
-            os.rmdir(root)
+    has_files = False
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            else:
+                has_files = True
+
+    # Children first, so parents left empty are removed too
+    for subdir in subdirs:
+        prune_empty_dirs(subdir, is_root=False)
+
+    if not is_root and not has_files:
+        os.rmdir(path)
+
+def _probe(path : str, ext : str):
+    """get_metadata_raw, but a bad file is logged and skipped (None)
+    rather than taking down the whole run.
+    """
+    try:
+        return get_metadata_raw(path, ext)
+    except _PROBE_ERRORS as e:
+        print(e)
+        print(f"Failed to read metadata from '{path}'. Skipping.")
+        return None
 
 def process_dls(dl_folder : str):
-    for root, _, files in os.walk(dl_folder):
-        for file in files:
-            file_path = root + "/" + file
-            _, ext = os.path.splitext(file)
-
-            metadata_raw = get_metadata_raw(file_path)
-
-            metadata = MusicMetaData(
-                title    =  metadata_raw["title"], 
-                album    =  metadata_raw["album"],
-                artist   =  metadata_raw["artist"],
-                date     =  metadata_raw["date"],
-                encoding =  Encoding.from_string(ext),
-                )
+    """Read the tags of every media file in the downloads folder.
+
+    Return
+    ------
+    library : dict
+        One list per MusicMetaData field, index i of every list 
+        describes the same file.
+    """
+    paths = []
+    exts = []
+    for entry in _iter_files(dl_folder):
+        _, dot, ext = entry.name.rpartition(".")
+        ext = (dot + ext).lower() if dot else ""
+
+        # Skip anything we can't read tags from (covers, logs, etc.)
+        if ext not in _MEDIA_EXTS:
+            continue
+
+        paths.append(entry.path)
+        exts.append(ext)
+
+    # Probing is almost all I/O (and ffmpeg/libav work outside the GIL),
+    # so threads are enough to keep every core busy
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        metadata_raws = executor.map(_probe, paths, exts)
+
+    # Stored column-wise, so later grouping passes walk flat lists 
+    # instead of one object per file
+    library = {
+        "title"    : [],
+        "album"    : [],
+        "artist"   : [],
+        "date"     : [],
+        "encoding" : [],
+    }
+    for ext, metadata_raw in zip(exts, metadata_raws):
+        if metadata_raw is None:
+            continue
+        library["title"].append(metadata_raw.get("title"))
+        library["album"].append(metadata_raw.get("album"))
+        library["artist"].append(metadata_raw.get("artist"))
+        library["date"].append(metadata_raw.get("date"))
+        library["encoding"].append(Encoding.from_string(ext))
+
+    return library
 
 def main():
     process_dls(MUSIC_DLS_FOLDER)
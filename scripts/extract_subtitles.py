@@ -38,74 +38,266 @@
 
 import os
 import re
-import pymkv
+import json
 import subprocess
 import pymongo
 import configparser
-# import ass
-# import pysrt
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pysubs2
+
+# ASS override blocks, e.g. {\an8}
+_ASS_TAG_RE = re.compile(r"\{[^}]+\}")
+
+# Extensions of the subtitle files we write
+_SUBTITLE_EXTS = ("ass", "srt", "vob")
+
+# Subtitle files we write: {filename}.{track_key}.{ext}
+_SUBTITLE_FILE_RE = re.compile(
+    rf"^(?P<prefix>.+?)\.(?P<key>[^.]+)\.(?:{'|'.join(_SUBTITLE_EXTS)})$")
+
+# Subtitles are written to the db in batches of this many episodes
+_SUBTITLE_WRITE_BATCH = 100
+
+# Shared stand-in for an episode with no subtitles on disk
+_EMPTY = frozenset()
+
+# The handful of mkvmerge track fields we care about
+Track = namedtuple("Track", "track_id track_codec track_name language")
 
 
 def clean_ass_text(text: str) -> str:
-    return re.sub("{[^}]+}", "", text.replace("\\N", "\n"))
+    return _ASS_TAG_RE.sub("", text.replace("\\N", "\n"))
 
 
-def subtrack_to_key(subtrack: dict) -> str:
+def subtrack_to_key(subtrack: Track) -> str:
     def clean(s: str) -> str: return s.replace('.', '').replace('/', '')
     return clean(subtrack.track_name) if subtrack.track_name else f"{clean(subtrack.language)}-{subtrack.track_id}"
 
 
-def get_subtitle_tracks_mkv(path_episode: str) -> list:
+def get_subtitle_tracks_mkv(path_episode: str) -> list | None:
+    """List the subtitle tracks in an MKV.
+    Reads mkvmerge's JSON identification directly, we only need a few
+    fields per track.
+
+    Returns:
+        list | None: (track_key, Track) for each subtitle track,
+                     or None if mkvmerge failed.
+    """
     try:
-        mkv = pymkv.MKVFile(path_episode)
-        subtitle_tracks = [(subtrack_to_key(track), track)
-                           for track in mkv.tracks if track.track_type == 'subtitles']
+        status_identify = subprocess.run(["mkvmerge", "-J", path_episode],
+                                         capture_output=True, check=True)
+        info = json.loads(status_identify.stdout)
+
+        subtitle_tracks = []
+        for track_info in info.get("tracks", []):
+            if track_info["type"] != "subtitles":
+                continue
+
+            properties = track_info.get("properties", {})
+            track = Track(track_id=track_info["id"],
+                          track_codec=properties.get("codec_id", ""),
+                          track_name=properties.get("track_name"),
+                          language=properties.get("language", "und"))
+            subtitle_tracks.append((subtrack_to_key(track), track))
+
         return subtitle_tracks
     except BaseException as e:
         print(e)
 
-    return []
+    return None
 
 
-def extract_subtitles_mkv(path_episode: str, subtitles_out_dir: str,  track: pymkv.MKVTrack) -> bool:
+def plan_subtitle_extraction(path_episode: str, subtitles_out_dir: str, track: Track) -> tuple | None:
+    """Work out where a subtitle track should be extracted to.
+
+    Returns:
+        tuple | None: (track_id, path_subtitles_out), or None if we
+                      can't handle this track's codec.
+    """
 
     ext = ""
-    if track.track_codec == "SubStationAlpha":
+    if track.track_codec in ("S_TEXT/ASS", "S_TEXT/SSA"):
         ext = "ass"
-    elif track.track_codec == "SubRip/SRT":
+    elif track.track_codec == "S_TEXT/UTF8":
         ext = "srt"
-    elif track.track_codec == "VobSub":
+    elif track.track_codec == "S_VOBSUB":
         ext = "vob"
         print("  TODO: Implement VobSub OCR conversion...")
-        return False
+        return None
     else:
         # raise Exception(f"Help idk what to do with \"{track.track_codec}\"")
         print(f"   Help idk what to do with \"{track.track_codec}\"")
-        return False
+        return None
 
     # Path to subtitles will follow an identicle structure as the video path
     filename = os.path.splitext(os.path.basename(path_episode))[0]
     path_subtitles_out = f"{subtitles_out_dir}/{filename}.{subtrack_to_key(track)}.{ext}"
 
-    try:
-        # Extract the subtritles into an srt file
-        status_extract = subprocess.run(["mkvextract",
-                                        path_episode,
-                                        "tracks",
-                                         f"{track.track_id}:{path_subtitles_out}"],
-                                        check=True)
-        if status_extract.returncode != 0:
-            print(
-                f"Failed to extract subtitles track {track.track_id} from {path_episode}")
-            return False
-
-    except subprocess.CalledProcessError as e:
-        print(e)
+    return track.track_id, path_subtitles_out
+
+
+def extract_subtitles_batch(path_episode: str, plans: list) -> bool:
+    """Extract several subtitle tracks with a single mkvextract call,
+    so the MKV is only read through once.
+
+    Args:
+        path_episode (str): Path to the MKV.
+        plans (list): (track_id, path_subtitles_out) pairs.
+
+    Returns:
+        bool: True if every track was extracted.
+    """
+    if not plans:
+        return True
+
+    # Extract the subtritles into their own files
+    # mkvextract's progress output is of no use to us, only look at stderr if it fails
+    status_extract = subprocess.run(["mkvextract",
+                                     path_episode,
+                                     "tracks",
+                                     *[f"{track_id}:{path_out}" for track_id, path_out in plans]],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+    if status_extract.returncode != 0:
+        print(f"Failed to extract subtitles from {path_episode}")
+        print(status_extract.stderr.decode("utf-8", "replace"))
         return False
 
     return True
 
 
+def load_subtitle_cues(path_subtitles: str) -> list:
+    """Parse an extracted subtitle file into the cues we store in the db.
+
+    Returns:
+        list: {index, start_ms, end_ms, text} for each dialogue line.
+    """
+    subs = pysubs2.load(path_subtitles, encoding="utf-8")
+    cues = []
+    for event in subs:
+        if event.is_comment:
+            continue
+        cues.append({"index": len(cues),
+                     "start_ms": event.start,
+                     "end_ms": event.end,
+                     "text": clean_ass_text(event.text)})
+    return cues
+
+
+def group_subtitle_keys(subtitles_out_dir: str) -> dict:
+    """List the subtitle files in a series' folder once,
+    grouped by the episode they belong to.
+
+    Returns:
+        dict: episode filename -> set of track_keys on disk.
+    """
+    keys_by_filename = defaultdict(set)
+    with os.scandir(subtitles_out_dir) as it_subtitles:
+        for entry in it_subtitles:
+            if match := _SUBTITLE_FILE_RE.match(entry.name):
+                keys_by_filename[match.group("prefix")].add(match.group("key"))
+    return keys_by_filename
+
+
+def load_stored_subtitle_keys(collection: pymongo.collection.Collection) -> dict:
+    """List which subtitle tracks are already stored for each episode,
+    without pulling the cues themselves out of the db.
+
+    Returns:
+        dict: (title, episode) -> set of track_keys in the db.
+    """
+    pipeline = [{"$project": {"episodes": {"$map": {
+        "input": {"$objectToArray": {"$ifNull": ["$episodes", {}]}},
+        "as": "episode",
+        "in": {"k": "$$episode.k",
+               "v": {"$map": {"input": {"$objectToArray": "$$episode.v"},
+                              "as": "track",
+                              "in": "$$track.k"}}}}}}}]
+
+    keys_in_db = {}
+    for doc in collection.aggregate(pipeline):
+        for episode in doc["episodes"]:
+            keys_in_db[(doc["_id"], episode["k"])] = frozenset(episode["v"])
+    return keys_in_db
+
+
+def process_episode(path_episode: str, subtitles_out_dir: str, keys_on_file: set = _EMPTY,
+                    keys_in_db: set = _EMPTY, cached: dict | None = None, overwrite=False) -> tuple:
+    """Extract any subtitles from an episode that aren't on disk yet,
+    and parse any that aren't in the db yet.
+
+    Args:
+        path_episode (str): Path to the MKV.
+        subtitles_out_dir (str): Folder the subtitle files are written to.
+        keys_on_file (set): track_keys of this episode's subtitles already on disk.
+        keys_in_db (set): track_keys of this episode's subtitles already in the db.
+        cached (dict | None): This episode's `subtitles_meta` entry from the last run.
+        overwrite (bool): Extract and parse even if the subtitles are already on disk.
+
+    Returns:
+        tuple: (extracted, fasthash)
+               extracted is a list of (track_key, cues) for each track to store,
+               fasthash is the new `subtitles_meta` entry, or None if it shouldn't change.
+               Only record fasthash once the cues are stored.
+    """
+
+    if overwrite:
+        keys_on_file = _EMPTY
+        keys_in_db = _EMPTY
+
+    # If the MKV hasn't been touched since the last run,
+    # and everything we pulled out of it last time is still on disk and in the db,
+    # then there is no need to even open it.
+    st = os.stat(path_episode)
+    if not overwrite and cached \
+            and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns \
+            and frozenset(cached["keys"]) <= keys_on_file & keys_in_db:
+        return [], None
+
+    # Extraction is VERY expensive
+    # Before extracting anything,
+    # first check to see if there is anything in this MKV
+    # we don't already have in the db
+    # An MKV without subtitles still gets a fasthash entry (with no keys),
+    # so it isn't opened again. Only a failed read is left uncached.
+    track_list = get_subtitle_tracks_mkv(path_episode)
+    if track_list is None:
+        return [], None
+
+    # Only plan the tracks we know how to extract
+    keys = []
+    plans = []
+    for key, track in track_list:
+        plan = plan_subtitle_extraction(path_episode, subtitles_out_dir, track)
+        if plan:
+            keys.append(key)
+            plans.append(plan)
+
+    fasthash = {"_id": path_episode, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "keys": keys}
+
+    # Get the subtitles that aren't on disk yet, every track in one pass over the file
+    if not extract_subtitles_batch(path_episode,
+                                   [plan for key, plan in zip(keys, plans) if key not in keys_on_file]):
+        return [], None
+
+    # Parse every track that isn't in the db yet,
+    # including files an older run left on disk.
+    # Fresh files are still hot in the page cache.
+    extracted = []
+    for key, (_, path_out) in zip(keys, plans):
+        if key in keys_on_file and key in keys_in_db:
+            continue
+        try:
+            extracted.append((key, load_subtitle_cues(path_out)))
+        except Exception as e:
+            print(e)
+            print(f"Failed to parse subtitles from {path_out}")
+            # Leave the fasthash alone, so this episode is tried again next run
+            fasthash = None
+
+    return extracted, fasthash
+
+
 def update_subtitle_db(path_videos: str, connection_str: str, overwrite=False):
     """Scan through all videos in the video folder and store their subtitles
     In the DB.
@@ -143,47 +335,110 @@ def update_subtitle_db(path_videos: str, connection_str: str, overwrite=False):
     db_metadata = db["mediaMetadata"]
     collection = db_metadata["subtitles"]
 
-    # Loop through all episodes in the video collection
-    for title in os.listdir(path_videos):
-        path_title = f"{path_videos}/{title}"
-        print(f"Processing {path_title}")
-        for episode in os.listdir(path_title):
-            path_episode = f"{path_title}/{episode}"
-            filename, ext = os.path.splitext(episode)
+    # Size + mtime of every MKV we've already scanned ("fasthash"),
+    # lets us skip opening files that haven't changed since the last run
+    fasthash_col = db_metadata["subtitles_meta"]
+    fasthash_cache = {doc["_id"]: doc for doc in fasthash_col.find()}
 
-            # Set up the output directory for
-            subtitles_out_dir = f"./subtitles/{title}"
-            if not os.path.exists(subtitles_out_dir):
-                os.makedirs(subtitles_out_dir)
+    # Which tracks each episode already has in the db
+    keys_in_db = load_stored_subtitle_keys(collection)
 
-            # This only works on MKVs
-            # And idk if I plan to support other formats tbh..
-            if ext.lower() != ".mkv":
+    # Gather every episode up front, so the extraction can be spread
+    # across processes
+    jobs = []
+    with os.scandir(path_videos) as it_titles:
+        for entry_title in it_titles:
+            if not entry_title.is_dir(follow_symlinks=False):
                 continue
 
-            # Extraction is VERY expensive
-            # Before extracting anything,
-            # first check to see if there is anything in this MKV
-            # we don't already have in the db
-            track_list = get_subtitle_tracks_mkv(path_episode)
-            if not track_list:
-                continue
+            title = entry_title.name
+            episodes = []
+            with os.scandir(entry_title.path) as it_episodes:
+                for entry_episode in it_episodes:
+                    # This only works on MKVs
+                    # And idk if I plan to support other formats tbh..
+                    if not entry_episode.is_file(follow_symlinks=False) \
+                            or not entry_episode.name.lower().endswith(".mkv"):
+                        continue
 
-            # This line is chaotic and beatuiful so we're keeping it
-            # Essentially: Loop through all files in the directory that match the pattern of this episode
-            # Extract the track_key from each file name and compare it to the track_keys in the mkv
-            # If all are a match, then there is nothing to do here.
-            subtitle_files = os.listdir(subtitles_out_dir)
-            is_subtitles_on_file = subtitle_files and all(
-                [f[len(filename)+1:-4] in [key for key, _ in track_list]
-                 for f in subtitle_files if re.match(filename, f)])
-            if is_subtitles_on_file:
+                    episodes.append(entry_episode)
+
+            if not episodes:
                 continue
 
-            # Get the subtitles from each track
-            for _, track in track_list:
-                extract_subtitles_mkv(path_episode, subtitles_out_dir, track)
+            # Set up the output directory for this series
+            subtitles_out_dir = f"./subtitles/{title}"
+            os.makedirs(subtitles_out_dir, exist_ok=True)
+
+            # One listing of the series' subtitles, shared by all its episodes
+            keys_by_filename = group_subtitle_keys(subtitles_out_dir)
+            for entry_episode in episodes:
+                filename = entry_episode.name[:-4]
+                jobs.append((entry_episode.path, subtitles_out_dir,
+                             keys_by_filename.get(filename, _EMPTY),
+                             keys_in_db.get((title, filename.replace('.', '')), _EMPTY)))
+
+    # Cues are written in batches, and each episode's fasthash entry only once
+    # its cues are stored: (index into subtitle_updates or None, ReplaceOne)
+    subtitle_updates = []
+    fasthash_updates = []
+
+    def flush_updates():
+        failed = set()
+        if subtitle_updates:
+            try:
+                collection.bulk_write(subtitle_updates, ordered=False)
+            except pymongo.errors.BulkWriteError as e:
+                failed = {error["index"] for error in e.details["writeErrors"]}
+            except pymongo.errors.PyMongoError as e:
+                print(e)
+                failed = set(range(len(subtitle_updates)))
+            if failed:
+                print(f"Failed to store subtitles for {len(failed)} episode(s), they will be retried next run.")
+
+        stored = [op for subtitle_index, op in fasthash_updates if subtitle_index not in failed]
+        if stored:
+            fasthash_col.bulk_write(stored, ordered=False)
+
+        subtitle_updates.clear()
+        fasthash_updates.clear()
+
+    # mkvextract is disk bound, so keep several episodes in flight
+    # Whatever was extracted is written back, even if the run is cut short
+    try:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = {executor.submit(process_episode, path_episode, subtitles_out_dir, keys_on_file,
+                                       keys_stored, fasthash_cache.get(path_episode), overwrite): path_episode
+                       for path_episode, subtitles_out_dir, keys_on_file, keys_stored in jobs}
+            for future in as_completed(futures):
+                path_episode = futures[future]
+
+                # One bad episode shouldn't take down the rest of the run
+                try:
+                    extracted, fasthash = future.result()
+                except Exception as e:
+                    print(e)
+                    print(f"Failed to process {path_episode}. Skipping.")
+                    continue
+
+                subtitle_index = None
+                if extracted:
+                    title = os.path.basename(os.path.dirname(path_episode))
+                    episode = os.path.splitext(os.path.basename(path_episode))[0].replace('.', '')
+                    subtitle_index = len(subtitle_updates)
+                    subtitle_updates.append(pymongo.UpdateOne(
+                        {"_id": title},
+                        {"$set": {f"episodes.{episode}.{key}": cues for key, cues in extracted}},
+                        upsert=True))
+                    print(f"Extracted {len(extracted)} track(s) from {path_episode}")
+                if fasthash:
+                    fasthash_updates.append((subtitle_index,
+                                             pymongo.ReplaceOne({"_id": fasthash["_id"]}, fasthash, upsert=True)))
 
+                if _SUBTITLE_WRITE_BATCH <= len(subtitle_updates):
+                    flush_updates()
+    finally:
+        flush_updates()
 
 if __name__ == "__main__":
     if "DB_ADDRESS" not in os.environ:
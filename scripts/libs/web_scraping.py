@@ -31,17 +31,99 @@
 #               media types in this program.
 #
 # ============================================================================ #
+from functools import lru_cache
+from os import scandir, stat
 from os.path import isdir, isfile
 
+import asyncio
+import atexit
+import configparser
 import googlesearch
 import re
-from time import sleep
 import pymongo
+import requests
+import shelve
 
+import aiohttp
+import lxml.html
 from bs4 import BeautifulSoup
-
-from urllib.error import HTTPError
-from urllib.request import urlopen, urlretrieve, Request
+from lxml import etree
+
+from urllib.parse import urlparse
+
+# Politeness limits: one request in flight per site, a few in total
+_GLOBAL_LIMIT = asyncio.Semaphore(8)
+_HOST_LIMITS = {}
+
+# Pooled connections shared by every request made through make_session()
+_CONNECTOR_LIMIT = 16
+_CONNECTOR_LIMIT_PER_HOST = 8
+_DNS_CACHE_TTL = 300
+
+# Sent with every request made through make_session()
+_USER_AGENT = 'Mozilla/5.0 (Windows; U; Windows NT 5.1; en-US; rv:1.9.0.7) Gecko/2009021910 Firefox/3.0.7'
+
+# Images are written to disk as they come in, rather than buffered whole
+_DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+# Rate limited (429) or briefly unavailable responses are retried,
+# backing off exponentially unless the server says how long to wait
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+_MAX_RETRIES = 3
+_RETRY_BACKOFF = 2.0
+
+# Google is rate limited like any other site we scrape
+_GOOGLE_URL = "https://www.google.com/"
+
+# Search APIs that hand back a site's canonical page url for a title
+_JIKAN_SEARCH_URL = "https://api.jikan.moe/v4/anime"
+_WIKIPEDIA_SEARCH_URL = "https://en.wikipedia.org/w/api.php"
+_MANGAUPDATES_SEARCH_URL = "https://api.mangaupdates.com/v1/series/search"
+
+# Search apis rate limit us (Jikan allows about 60 requests a minute),
+# so requests to the same api host are spaced at least this many seconds apart
+_API_MIN_INTERVAL = 1.2
+_API_LAST_REQUEST = {}
+
+# Page urls found by the search helpers, kept between runs
+_URL_CACHE_PATH = "url_cache"
+_url_cache = None
+
+# Date formats extract_year understands, e.g. "April 3, 1998", "April 3 1998", "3 April 1998"
+_YEAR_RE = re.compile(r"(?:[a-zA-Z]+ [0-9]{1,2},? |[0-9]{1,2} [a-zA-Z]+ )(?P<year>[0-9]{4})")
+
+# Page urls we trust from each site
+_MANGAUPDATES_URL_RE = re.compile(r"https:\/\/www\.mangaupdates\.com\/.+")
+_MAL_URL_RE = re.compile(r"https:\/\/myanimelist\.net\/anime\/.+")
+_WIKIPEDIA_URL_RE = re.compile(r"https:\/\/en\.wikipedia\.org\/wiki\/.+")
+_IMDB_URL_RE = re.compile(r"https:\/\/www\.imdb\.com\/title\/.+")
+
+# lxml xpaths for the infobox rows (<th>Key</th><td>Value</td>) on Wikipedia,
+# and the MAL leftside categories (<span>Key:</span> Value)
+_WIKIPEDIA_INFOBOX_XPATH = etree.XPath(
+    '//table[contains(concat(" ", normalize-space(@class), " "), " infobox ")]')
+_WIKIPEDIA_ROW_XPATH = etree.XPath('.//tr[th and td]')
+_MAL_LEFTSIDE_XPATH = etree.XPath(
+    '//div[contains(concat(" ", normalize-space(@class), " "), " leftside ")]')
+_MAL_CATEGORY_XPATH = etree.XPath(
+    './/div[contains(concat(" ", normalize-space(@class), " "), " spaceit_pad ")][.//span]')
+
+# Trailing citation marker on wikipedia values, e.g. "1999[3]"
+_CITATION_RE = re.compile(r"\[[0-9]+\]$")
+
+# Metadata is just re-scraped if a write is lost, so bulk writes
+# only wait for the primary to apply them, not for the journal
+_BULK_WRITE_CONCERN = pymongo.WriteConcern(w=1, j=False)
+
+# Formats accepted by fmt_check, keyed by parameter type
+_FMT_PATTERNS = {
+    'title': re.compile(r'[\w :;\\,\.\-]+'),
+    'title-jp': re.compile(r'[一-龠]+|[ぁ-ゔ]+|[ァ-ヴー]+|[ａ-ｚＡ-Ｚ０-９]+|[々〆〤]+'),
+    'animator': re.compile(r'[\w ,\.\-]+'),
+    'tags': re.compile(r'[\w ,\-]+'),
+    'numberOfEpisodes': re.compile(r'\d+'),
+    'date': re.compile(r'\d\d\.\d\d\.\d\d\d\d'),
+}
 
 
 def extract_year(text: str) -> str | None:
@@ -56,28 +138,33 @@ def extract_year(text: str) -> str | None:
         str | None: The first year in that string.
     """
 
-    date_match = re.search(
-        r"[a-zA-Z]+ [0-9][0-9]?, [0-9][0-9][0-9][0-9]", text)
-    if date_match:
-        group = date_match.group()
-        if group:
-            return group.split(", ")[1]
+    date_match = _YEAR_RE.search(text)
+    return date_match.group("year") if date_match else None
 
-    date_match = re.search(
-        r"[a-zA-Z]+ [0-9][0-9]? [0-9][0-9][0-9][0-9]", text)
-    if date_match:
-        group = date_match.group()
-        if group:
-            return group.split(" ")[2]
 
-    date_match = re.search(
-        r"[0-9][0-9]? [a-zA-Z]+ [0-9][0-9][0-9][0-9]", text)
-    if date_match:
-        group = date_match.group()
-        if group:
-            return group.split(" ")[2]
+@lru_cache(maxsize=None)
+def _load_config(path: str, mtime_ns: int | None) -> configparser.ConfigParser:
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
 
-    return None
+
+def load_config(path: str = "config.ini") -> configparser.ConfigParser:
+    """Load the config file.
+    The parse is cached per modification time, so repeat calls within
+    one process only re-read the file when it has changed.
+
+    Args:
+        path (str): Path to the ini file.
+
+    Returns:
+        configparser.ConfigParser: The parsed config (empty if missing).
+    """
+    try:
+        mtime_ns = stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = None
+    return _load_config(path, mtime_ns)
 
 
 def check_for_config_issues(config, required_parameters=[], folder_parameters=[]):
@@ -109,51 +196,86 @@ def check_for_config_issues(config, required_parameters=[], folder_parameters=[]
     return config_valid
 
 
-def load_meta_data(db_name: str, title: str, connection_str: str) -> dict:
+@lru_cache(maxsize=4)
+def get_client(connection_str: str) -> pymongo.MongoClient:
+    """Get the (cached) client for a db connection string.
+    MongoClient is a thread-safe connection pool, so it is opened once
+    and reused rather than reconnecting for every query.
+    Fails fast if the server can't be reached.
     """
-        Loads the metadata from the given address.
-        Returns the data in a dicitonary.
+    return pymongo.MongoClient(connection_str, maxPoolSize=32, serverSelectionTimeoutMS=5000)
+
+
+def get_collection(db_name: str, connection_str: str) -> pymongo.collection.Collection:
+    """Get the 'db_name' metadata collection, on the shared client.
+    Open this once per script and pass it to the metadata helpers below.
     """
+    return get_client(connection_str)["mediaMetadata"][db_name]
 
-    db = pymongo.MongoClient(connection_str)
-    db_metadata = db["mediaMetadata"]
-    collection = db_metadata[db_name]
 
-    metadata = collection.find_one({"_id": title})
+def load_meta_data(collection: pymongo.collection.Collection, title: str) -> dict:
+    """
+        Loads the metadata for 'title' from the collection.
+        Returns the data in a dicitonary.
+    """
 
-    db.close()
+    metadata = collection.find_one({"_id": title})
 
     return metadata if metadata else {}
 
 
-def store_meta_data(db_name: str, meta_data: dict, connection_str: str):
+def load_meta_data_many(collection: pymongo.collection.Collection, titles: list) -> dict:
     """
-        Formats 'meta_data' dictionary as an ini file
-        and stores it in 'address'
+        Loads the metadata for every title in one query.
+        Returns a dictionary of title -> metadata, titles without any are left out.
     """
 
-    db = pymongo.MongoClient(connection_str)
-    db_metadata = db["mediaMetadata"]
-    collection = db_metadata[db_name]
+    return {doc["_id"]: doc for doc in collection.find({"_id": {"$in": list(titles)}})}
+
 
-    collection.insert_one(meta_data)
+def store_meta_data(collection: pymongo.collection.Collection, meta_data: dict | list):
+    """
+        Inserts the 'meta_data' document, or list of documents,
+        into the collection.
+    """
 
-    db.close()
+    docs = [meta_data] if isinstance(meta_data, dict) else list(meta_data)
+    if docs:
+        collection.insert_many(docs, ordered=False)
 
 
-def update_meta_data(db_name: str, title: str, meta_data: dict, connection_str: str):
+def upsert_meta_data_many(collection: pymongo.collection.Collection, meta_data_list: list):
     """
-        Formats 'meta_data' dictionary as an ini file
-        and stores it in 'address'
+        Upserts (title, meta_data) pairs into the collection,
+        all in one round trip.
     """
 
-    db = pymongo.MongoClient(connection_str)
-    db_metadata = db["mediaMetadata"]
-    collection = db_metadata[db_name]
+    ops = [pymongo.UpdateOne({"_id": title},
+                             {"$set": {key: val for key, val in meta_data.items() if key != "_id"}},
+                             upsert=True)
+           for title, meta_data in meta_data_list]
+    if ops:
+        collection.with_options(write_concern=_BULK_WRITE_CONCERN).bulk_write(ops, ordered=False)
+
+
+def update_meta_data(collection: pymongo.collection.Collection, title: str, meta_data: dict):
+    """
+        Updates the metadata for 'title' with the 'meta_data' fields.
+    """
 
     collection.update_one({"_id": title}, {"$set": meta_data})
 
-    db.close()
+
+def scandir_ordered(path: str, sort_by_inode=False) -> list:
+    """List a directory's entries, optionally in inode order.
+    On spinning disks, inode order roughly follows the layout on the platter,
+    so visiting entries in that order cuts down on seeks.
+    """
+    with scandir(path) as it_entries:
+        entries = list(it_entries)
+    if sort_by_inode:
+        entries.sort(key=lambda entry: entry.inode())
+    return entries
 
 
 def determine_missing_required_params(meta_data: dict, required_params: list):
@@ -164,12 +286,20 @@ def determine_missing_required_params(meta_data: dict, required_params: list):
     # Search for missing parameters
     missing_params = set()
     for key in required_params:
-        if key not in meta_data.keys() or meta_data[key] == "":
+        if meta_data.get(key, "") == "":
             missing_params.add(key)
 
     return missing_params
 
 
+def _host_limit(url: str) -> asyncio.Semaphore:
+    """Get the semaphore limiting requests to the host of this url."""
+    host = urlparse(url).netloc
+    if host not in _HOST_LIMITS:
+        _HOST_LIMITS[host] = asyncio.Semaphore(1)
+    return _HOST_LIMITS[host]
+
+
 def get_top_url(search_query: str) -> str:
     """Utility for getting the first URL result from a google search query."""
     urls = googlesearch.search(search_query, num_results=1, timeout=5)
@@ -177,7 +307,151 @@ def get_top_url(search_query: str) -> str:
     return urls[0] if 0 < len(urls) else ""
 
 
-def get_image(img_url: str, addr_store: str):
+async def get_top_url_async(search_query: str, delay=5.0) -> str | None:
+    """get_top_url, run off the event loop and limited like any other site.
+    Waits 'delay' seconds before each search, and backs off if Google refuses us.
+    Returns None if every attempt is refused.
+    """
+    async with _host_limit(_GOOGLE_URL):
+        for attempt in range(_MAX_RETRIES + 1):
+            print(f"Waiting {delay} seconds before requesting from server...")
+            await asyncio.sleep(delay)
+
+            try:
+                return await asyncio.to_thread(get_top_url, search_query)
+            except requests.RequestException as e:
+                print(e)
+                print(f"Google refused the search for '{search_query}'.")
+            delay += _RETRY_BACKOFF * 2 ** attempt
+
+    return None
+
+
+def _get_url_cache() -> shelve.Shelf:
+    """Open the on-disk url cache the first time it's needed."""
+    global _url_cache
+    if _url_cache is None:
+        _url_cache = shelve.open(_URL_CACHE_PATH)
+        atexit.register(_url_cache.close)
+    return _url_cache
+
+
+def _retry_delay(response: aiohttp.ClientResponse, attempt: int) -> float:
+    """How long to wait before retrying, honouring the server's Retry-After."""
+    retry_after = response.headers.get("Retry-After", "")
+    return float(retry_after) if retry_after.isdigit() else _RETRY_BACKOFF * 2 ** attempt
+
+
+async def _request_with_retry(session: aiohttp.ClientSession, method: str, url: str, read, **kwargs):
+    """Make a request, retrying while the server is rate limiting us.
+    read(response) pulls the body out of the final response.
+    Raises aiohttp.ClientResponseError on any other bad status.
+    """
+    for attempt in range(_MAX_RETRIES + 1):
+        async with session.request(method, url, **kwargs) as response:
+            if response.status not in _RETRY_STATUSES or attempt == _MAX_RETRIES:
+                response.raise_for_status()
+                return await read(response)
+            delay = _retry_delay(response, attempt)
+
+        print(f"'{url}' returned {response.status}, retrying in {delay} seconds...")
+        await asyncio.sleep(delay)
+
+
+async def _request_json(session: aiohttp.ClientSession, method: str, url: str, **kwargs):
+    """Query a json api, limited like any other site,
+    and no more often than once every _API_MIN_INTERVAL seconds per host.
+    Returns None on failure.
+    """
+    # Queue on the host first, so tasks waiting on a busy site don't hold global slots
+    async with _host_limit(url):
+        host = urlparse(url).netloc
+        loop = asyncio.get_running_loop()
+        wait = _API_LAST_REQUEST.get(host, 0.0) + _API_MIN_INTERVAL - loop.time()
+        if 0 < wait:
+            await asyncio.sleep(wait)
+
+        async with _GLOBAL_LIMIT:
+            _API_LAST_REQUEST[host] = loop.time()
+            try:
+                return await _request_with_retry(session, method, url,
+                                                 lambda response: response.json(content_type=None),
+                                                 **kwargs)
+            except aiohttp.ClientResponseError:
+                print(f"HTTP connection was denied to '{url}'.")
+            except Exception as e:
+                print(e)
+                print(f"Unknown Error in accessing '{url}'.")
+
+    return None
+
+
+async def _find_url_cached(site: str, title: str, find) -> str | None:
+    """Look up a title's page url in the cache, else search for it with find().
+    Only hits are cached, so failed searches are retried next run.
+    Returns "" if the search found nothing, None if the search itself failed.
+    """
+    cache = _get_url_cache()
+    key = f"{site}:{title}"
+    if key in cache:
+        return cache[key]
+
+    url = await find()
+    if url:
+        cache[key] = url
+    return url
+
+
+async def find_mal_url(session: aiohttp.ClientSession, title: str) -> str | None:
+    """Get the MAL page for an anime title, via the Jikan api."""
+    async def find():
+        response = await _request_json(session, "GET", _JIKAN_SEARCH_URL,
+                                       params={"q": title, "limit": 1})
+        if response is None:
+            return None
+        return response["data"][0]["url"] if response.get("data") else ""
+    return await _find_url_cached("mal", title, find)
+
+
+async def find_wikipedia_url(session: aiohttp.ClientSession, title: str) -> str | None:
+    """Get the Wikipedia page for a title, via the MediaWiki opensearch api."""
+    async def find():
+        # Format is [query, [titles], [descriptions], [urls]]
+        response = await _request_json(session, "GET", _WIKIPEDIA_SEARCH_URL,
+                                       params={"action": "opensearch", "search": title,
+                                               "limit": 1, "namespace": 0, "format": "json"})
+        if response is None:
+            return None
+        return response[3][0] if response[3] else ""
+    return await _find_url_cached("wikipedia", title, find)
+
+
+async def find_manga_updates_url(session: aiohttp.ClientSession, title: str) -> str | None:
+    """Get the MangaUpdates page for a manga title, via the MangaUpdates api."""
+    async def find():
+        response = await _request_json(session, "POST", _MANGAUPDATES_SEARCH_URL,
+                                       json={"search": title, "perpage": 1})
+        if response is None:
+            return None
+        return response["results"][0]["record"]["url"] if response.get("results") else ""
+    return await _find_url_cached("mangaupdates", title, find)
+
+
+def make_session() -> aiohttp.ClientSession:
+    """Create the session to share across every get_soup/get_image call.
+    Keeps connections (and DNS lookups) alive between requests to the same site,
+    so each title's fetches don't pay for a new handshake.
+    Must be called from inside the running event loop.
+    """
+    connector = aiohttp.TCPConnector(limit=_CONNECTOR_LIMIT,
+                                     limit_per_host=_CONNECTOR_LIMIT_PER_HOST,
+                                     ttl_dns_cache=_DNS_CACHE_TTL)
+    return aiohttp.ClientSession(connector=connector,
+                                 headers={'User-Agent': _USER_AGENT},
+                                 timeout=aiohttp.ClientTimeout(sock_connect=10, sock_read=10))
+
+
+async def get_image(session: aiohttp.ClientSession, img_url: str, addr_store: str):
     """Utility for downloading an image.
 
     Returns
@@ -185,10 +459,14 @@ def get_image(img_url: str, addr_store: str):
     True on successful download, ELSE False.
     """
     try:
-        path, _ = urlretrieve(img_url, addr_store)
-        if path == addr_store:
-            return True
-    except HTTPError:
+        async with _GLOBAL_LIMIT:
+            async with session.get(img_url) as response:
+                response.raise_for_status()
+                with open(addr_store, "wb") as fp:
+                    async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+                        fp.write(chunk)
+        return True
+    except aiohttp.ClientResponseError:
         print(f"HTTP connection was denied to '{img_url}'.")
     except Exception as e:
         print(e)
@@ -206,49 +484,67 @@ def fmt_check(parameter: str, parameterType: str):
             parameterType - String describing the parameter class, TODO: Could be an enum.
     """
 
-    if parameterType == 'title':
-        return bool(re.match(r'[\w :;\\,\.\-]+', parameter))
-    elif parameterType == 'title-jp':
-        return bool(re.match(r'[一-龠]+|[ぁ-ゔ]+|[ァ-ヴー]+|[ａ-ｚＡ-Ｚ０-９]+|[々〆〤]+', parameter))
-    elif parameterType == 'animator':
-        return bool(re.match(r'[\w ,\.\-]+', parameter))
-    elif parameterType == 'tags':
-        return all([bool(re.match(r'[\w ,\-]+', tag)) for tag in parameter])
-    elif parameterType == 'numberOfEpisodes':
-        return bool(re.match(r'\d+', parameter))
-    elif parameterType == 'date':
-        return bool(re.match(r'\d\d\.\d\d\.\d\d\d\d', parameter))
+    if parameterType == 'tags':
+        pattern = _FMT_PATTERNS['tags']
+        return all(pattern.match(tag) for tag in parameter)
     elif parameterType == 'description':
         return 0 < len(parameter)
-    else:
-        return True
+
+    # Types without a pattern aren't checked
+    pattern = _FMT_PATTERNS.get(parameterType)
+    return bool(pattern.match(parameter)) if pattern else True
+
+
+async def get_html(session: aiohttp.ClientSession,
+                   url: str,
+                   user_agent=None,
+                   delay=5.0) -> bytes | None:
+    """
+        Politely fetch the raw html for the given webpage.
+        Returns None on failure.
+    """
+    # Queue on the host first, so tasks waiting on a busy site don't hold global slots
+    async with _host_limit(url):
+        print(f"Waiting {delay} seconds before requesting from server...")
+        await asyncio.sleep(delay)
+
+        async with _GLOBAL_LIMIT:
+            try:
+                headers = {'User-Agent': user_agent} if user_agent else None
+                return await _request_with_retry(session, "GET", url,
+                                                 lambda response: response.read(),
+                                                 headers=headers)
+            except aiohttp.ClientResponseError:
+                print(f"HTTP connection was denied to '{url}'.")
+            except Exception as e:
+                print(e)
+                print(f"Unknown Error in accessing '{url}'.")
+
+    return None
 
 
-def get_soup(url: str,
-             user_agent='Mozilla/5.0 (Windows; U; Windows NT 5.1; en-US; rv:1.9.0.7) Gecko/2009021910 Firefox/3.0.7',
-             delay=5.0):
+async def get_soup(session: aiohttp.ClientSession,
+                   url: str,
+                   user_agent=None,
+                   delay=5.0):
     """
         Gets a accessable datastructure for the given webpage. 
         Returns None on failure.
     """
-    print(
-        f"Waiting {delay} seconds before requesting from server", end="", flush=True)
-    for _ in range(int(delay)):
-        sleep(1)
-        print(".", end="", flush=True)
-    print()
+    html = await get_html(session, url, user_agent, delay)
+    return BeautifulSoup(html, 'lxml') if html else None
 
-    try:
-        req = Request(url, headers={'User-Agent': user_agent})
-        html = urlopen(req).read()
-        soup = BeautifulSoup(html, 'html.parser')
-        return soup
-    except HTTPError:
-        print(f"HTTP connection was denied to '{url}'.")
-    except:
-        print(f"Unknown Error in accessing '{url}'.")
 
-    return None
+async def get_tree(session: aiohttp.ClientSession,
+                   url: str,
+                   user_agent=None,
+                   delay=5.0):
+    """
+        Gets the lxml element tree for the given webpage, for xpath queries.
+        Returns None on failure.
+    """
+    html = await get_html(session, url, user_agent, delay)
+    return lxml.html.fromstring(html) if html else None
 
 
 def get_soup_local(addr: str):
@@ -260,23 +556,27 @@ def get_soup_local(addr: str):
 
     with open(addr, mode='r', encoding='utf-8') as fp:
         html = fp.read()
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = BeautifulSoup(html, 'lxml')
         return soup
 
 
-def download_manga_updates(title: str, thumbnail_addr: str):
+async def download_manga_updates(session: aiohttp.ClientSession, title: str, thumbnail_addr: str):
     """
         Extract the information from an MangaUpdates webpage. 
         Takes the url of the page as an arguement.
+        Returns None if the site couldn't be reached, so it is retried next run.
     """
 
     meta_data = {}
 
-    # Get the top url when searching for "{Manga Title} MangaUpdates"
-    url_top = get_top_url(title + " mangaupdates")
+    # Get the title's page from the MangaUpdates search
+    url_top = await find_manga_updates_url(session, title)
+    if url_top is None:
+        print("\tERROR! Failed to search MangaUpdates. Will try again next run.")
+        return None
 
     # Check that the url seems valid.
-    if not re.match(r"https:\/\/www\.mangaupdates\.com\/.+", url_top):
+    if not _MANGAUPDATES_URL_RE.match(url_top):
         print(
             f"\tWarning. Unsure about MangaUpdates link: '{url_top}'. Skipping MangaUpdates.")
         return {}
@@ -284,13 +584,14 @@ def download_manga_updates(title: str, thumbnail_addr: str):
     print(f"Grabbing data from MangaUpdates: '{url_top}'")
 
     # Read the webpage from the top web result
-    soup = get_soup(url_top)
+    soup = await get_soup(session, url_top)
     if not soup:
         print("\tERROR! Failed to access page. No data extracted.")
+        return None
 
     # Get all the catagorical information
     data = {}
-    categories = soup.find_all("div", {"class": "sCat"})
+    categories = soup.select("div.sCat")
     for category in categories:
         data[category.get_text().split('\xa0')[0]] = category.find_next('div')
 
@@ -302,7 +603,7 @@ def download_manga_updates(title: str, thumbnail_addr: str):
             if 0 < len(imgs):
                 icon_url = imgs[0]['src']
                 if icon_url:
-                    get_image(icon_url, thumbnail_addr)
+                    await get_image(session, icon_url, thumbnail_addr)
             else:
                 print("Can't find an image.")
 
@@ -377,69 +678,67 @@ def download_manga_updates(title: str, thumbnail_addr: str):
     return meta_data
 
 
-def download_my_anime_list(title: str, thumbnail_addr: str):
+async def download_my_anime_list(session: aiohttp.ClientSession, title: str, thumbnail_addr: str):
     """
         Extract the information from an MAL webpage. 
         Takes the url of the page as an arguement.
+        Returns None if the site couldn't be reached, so it is retried next run.
     """
 
     meta_data = {}
 
-    # Get the top url when searching for "{Anime Title} mal"
-    url_top = get_top_url(title + " mal")
+    # Get the title's page from the MAL search (Jikan)
+    url_top = await find_mal_url(session, title)
+    if url_top is None:
+        print("\tERROR! Failed to search MAL. Will try again next run.")
+        return None
 
     # Check that the url seems valid.
     # e.g.
     # https://myanimelist.net/anime/6372/Higashi_no_Eden_Movie_I__The_King_of_Eden
-    if not re.match(r"https:\/\/myanimelist\.net\/anime\/.+", url_top):
+    if not _MAL_URL_RE.match(url_top):
         print(f"\tWarning. Unsure about MAL link: '{url_top}'. Skipping MAL.")
         return {}
 
     print(f"Grabbing data from MAL: '{url_top}'")
 
     # Read the webpage from the top web result
-    soup = get_soup(url_top)
-    if not soup:
+    tree = await get_tree(session, url_top)
+    if tree is None:
         print("\tERROR! Failed to access page. No data extracted.")
+        return None
 
     # Get the description
-    description_p = soup.find("p", {"itemprop": "description"})
+    description_p = tree.xpath('//p[@itemprop="description"]')
     if description_p:
-        txt = description_p.get_text().strip()
+        txt = description_p[0].text_content().strip()
         if fmt_check(txt, 'description'):
             meta_data['description'] = txt
 
     # Get the "leftside" div that contains most of the metadata & image
-    leftside = soup.find("div", {"class": "leftside"})
+    leftside = _MAL_LEFTSIDE_XPATH(tree)
     if not leftside:
         print("\tERROR! MAL page doesn't have a leftside.")
-        return
+        return {}
+    leftside = leftside[0]
 
     # Download and cache the thumbnail
     if thumbnail_addr:
-        thumbnail_img = leftside.find('img')
+        thumbnail_img = leftside.xpath('.//img')
         if thumbnail_img:
-            icon_url = thumbnail_img['data-src']
+            icon_url = thumbnail_img[0].get('data-src')
             if icon_url:
-                get_image(icon_url, thumbnail_addr)
+                await get_image(session, icon_url, thumbnail_addr)
         else:
             print("Can't find an image.")
 
     # Get all the catagorical information from the left side
     # Format is <span>Key:</span> "Value"
     data = {}
-    categories = leftside.find_all("div", {"class": "spaceit_pad"})
-    for category in categories:
-        if not category:
-            continue
-
+    for category in _MAL_CATEGORY_XPATH(leftside):
         # Get the text found in the key
-        key_span = category.find("span")
-        if not key_span:
-            continue
-        text_key = key_span.get_text()
-
-        text_val = category.get_text()[len(text_key)+1:]
+        text_key = category.xpath("string((.//span)[1])")
+        text_val = category.text_content()[len(text_key)+1:]
 
         data[text_key.strip()[:-1]] = text_val.strip()
 
@@ -497,21 +796,25 @@ def download_my_anime_list(title: str, thumbnail_addr: str):
     return meta_data
 
 
-def download_wikipedia(title: str, thumbnail_addr: str):
+async def download_wikipedia(session: aiohttp.ClientSession, title: str, thumbnail_addr: str):
     """
         Extract the information from an WikiPedia webpage. 
         Takes the url of the page as an arguement.
+        Returns None if the site couldn't be reached, so it is retried next run.
     """
 
     meta_data = {}
 
-    # Get the top url when searching for "{Title} wikipedia"
-    url_top = get_top_url(title + " wikipedia")
+    # Get the title's page from the Wikipedia search
+    url_top = await find_wikipedia_url(session, title)
+    if url_top is None:
+        print("\tERROR! Failed to search Wikipedia. Will try again next run.")
+        return None
 
     # Check that the url seems valid.
     # e.g.
     # https://en.wikipedia.org/wiki/Kill_Bill:_Volume_1
-    if not re.match(r"https:\/\/en\.wikipedia\.org\/wiki\/.+", url_top):
+    if not _WIKIPEDIA_URL_RE.match(url_top):
         print(
             f"\tWarning. Unsure about Wikipedia link: '{url_top}'. Skipping Wikipedia.")
         return {}
@@ -519,47 +822,37 @@ def download_wikipedia(title: str, thumbnail_addr: str):
     print(f"Grabbing data from Wikipedia: '{url_top}'")
 
     # Read the webpage from the top web result
-    soup = get_soup(url_top)
-    if not soup:
+    tree = await get_tree(session, url_top)
+    if tree is None:
         print("\tERROR! Failed to access page. No data extracted.")
+        return None
 
     # Get the "infobox" div that contains most of the metadata & image
-    infobox = soup.find("table", {"class": "infobox"})
+    infobox = _WIKIPEDIA_INFOBOX_XPATH(tree)
     if not infobox:
         print("\tERROR! Wikipedia page doesn't have a infobox.")
-        return
+        return {}
+    infobox = infobox[0]
 
     # Download and cache the thumbnail
     # if thumbnail_addr:
-    #     thumbnail_img = infobox.find('img')
+    #     thumbnail_img = infobox.xpath('.//img')
     #     if thumbnail_img:
-    #         icon_url = thumbnail_img['src']
+    #         icon_url = thumbnail_img[0].get('src')
     #         if icon_url:
-    #             get_image(icon_url, thumbnail_addr)
+    #             await get_image(session, icon_url, thumbnail_addr)
     #     else:
     #         print("Can't find an image.")
 
     # Get all the catagorical information from the left side
     # Format is <th>Key:</th> <td>Key:</td>
     data = {}
-    categories = infobox.find_all("tr")
-    for category in categories:
-        if not category:
-            continue
-
-        # Get the text found in the key
-        key_span = category.find("th")
-        if not key_span:
-            continue
-        val_span = category.find("td")
-        if not val_span:
-            continue
-
-        text_key = key_span.get_text()
-        text_val = val_span.get_text()
+    for category in _WIKIPEDIA_ROW_XPATH(infobox):
+        text_key = category.xpath("string(th)")
+        text_val = category.xpath("string(td)")
 
         text_key = text_key.strip().replace(" ", "").replace("\n", "").lower()
-        text_val = re.sub(r"\[[0-9]+\]$", "", text_val.strip())
+        text_val = _CITATION_RE.sub("", text_val.strip())
 
         data[text_key] = text_val
 
@@ -592,21 +885,25 @@ def download_wikipedia(title: str, thumbnail_addr: str):
     return meta_data
 
 
-def download_imdb(title: str, thumbnail_addr: str):
+async def download_imdb(session: aiohttp.ClientSession, title: str, thumbnail_addr: str):
     """
         Extract the information from an IMDB webpage. 
         Takes the url of the page as an arguement.
+        Returns None if the site couldn't be reached, so it is retried next run.
     """
 
     meta_data = {}
 
     # Get the top url when searching for "{Title} imdb"
-    url_top = get_top_url(title + " imdb")
+    url_top = await get_top_url_async(title + " imdb")
+    if url_top is None:
+        print("\tERROR! Failed to search IMDB. Will try again next run.")
+        return None
 
     # Check that the url seems valid.
     # e.g.
     # https://www.imdb.com/title/tt0266697/
-    if not re.match(r"https:\/\/www\.imdb\.com\/title\/.+", url_top):
+    if not _IMDB_URL_RE.match(url_top):
         print(
             f"\tWarning. Unsure about IMDB link: '{url_top}'. Skipping IMDB.")
         return {}
@@ -614,9 +911,10 @@ def download_imdb(title: str, thumbnail_addr: str):
     print(f"Grabbing data from IMDB: '{url_top}'")
 
     # Read the webpage from the top web result
-    soup = get_soup(url_top)
+    soup = await get_soup(session, url_top)
     if not soup:
         print("\tERROR! Failed to access page. No data extracted.")
+        return None
 
     # Get the description
     description = soup.find("p", {"data-testid": "plot"})
@@ -631,7 +929,7 @@ def download_imdb(title: str, thumbnail_addr: str):
         if thumbnail_img:
             icon_url = thumbnail_img['src']
             if icon_url:
-                get_image(icon_url, thumbnail_addr)
+                await get_image(session, icon_url, thumbnail_addr)
         else:
             print("Can't find an image.")
 
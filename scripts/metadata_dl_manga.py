@@ -32,15 +32,31 @@
 #                  - MangaUpdates
 #
 # ============================================================================ #
+import asyncio
 import datetime
 import os
 import shutil
 import re
-import configparser
 
-from libs.web_scraping import check_for_config_issues, load_meta_data, \
-    determine_missing_required_params, store_meta_data, \
-    update_meta_data, download_manga_updates
+import aiohttp
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from libs.web_scraping import load_config, check_for_config_issues, scandir_ordered, \
+    get_collection, load_meta_data_many, determine_missing_required_params, \
+    upsert_meta_data_many, download_manga_updates, make_session
+
+# Characters that shouldn't be in a thumbnail's filename
+_TITLE_CLEAN_RE = re.compile(r"[?\/\\:]")
+
+# ioctl to reflink one file into another (Btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+# Metadata is written back to the db in batches of this many titles
+_BULK_WRITE_BATCH = 500
 
 
 def is_valid_manga_title(title: str) -> bool:
@@ -56,6 +72,21 @@ def is_valid_manga_title(title: str) -> bool:
     return not title.startswith("$")
 
 
+def fast_copy(path_src: str, path_dst: str):
+    """Copy a file, as a reflink if the filesystem supports it.
+    Otherwise falls back to shutil.copyfile, which copies in-kernel where it can.
+    """
+    if fcntl:
+        try:
+            with open(path_src, "rb") as fp_src, open(path_dst, "wb") as fp_dst:
+                fcntl.ioctl(fp_dst.fileno(), _FICLONE, fp_src.fileno())
+            return
+        except OSError:
+            pass
+
+    shutil.copyfile(path_src, path_dst)
+
+
 def get_manga_cover_art(manga_dir: str, caching_addr: str):
     """
         Get the first image from the manga and use it as a cover image.
@@ -67,36 +98,30 @@ def get_manga_cover_art(manga_dir: str, caching_addr: str):
         return
 
     # Get the first volume
-    vols = os.listdir(manga_dir)
-    if len(vols) == 0:
-        return
-    vols.sort()
-    vol_0 = vols[0]
-    dir_vol_0 = manga_dir+vol_0
-    if not os.path.isdir(dir_vol_0):
+    with os.scandir(manga_dir) as it_vols:
+        vol_0 = min(it_vols, key=lambda entry: entry.name, default=None)
+    if not vol_0 or not vol_0.is_dir():
         return
 
     # Get the first page of the first volume
-    pages = os.listdir(dir_vol_0)
-    if len(pages) == 0:
+    with os.scandir(vol_0.path) as it_pages:
+        page_0 = min(it_pages, key=lambda entry: entry.name, default=None)
+    if not page_0:
         return
-    pages.sort()
-    page_0 = pages[0]
-    path_page_0 = f"{dir_vol_0}/{page_0}"
+    path_page_0 = page_0.path
 
     # Use the first page as a thumbnail
-    shutil.copy(path_page_0, caching_addr)
+    fast_copy(path_page_0, caching_addr)
 
 
-def download_missing_manga_data():
+async def download_missing_manga_data(session: aiohttp.ClientSession):
     """
         Loop through the manga metadata files and verify that the necessary parameters are present.
         If they are not extract the information from the web.
     """
 
     # Load in the config data
-    config = configparser.ConfigParser()
-    config.read("config.ini")
+    config = load_config("config.ini")
 
     # Ensure that the required parameters are present and
     # defined correctly
@@ -115,85 +140,113 @@ def download_missing_manga_data():
         print("Exiting...")
         return
 
-    required_metadata = config["webscraping"]["RequiredMetadataManga"].split(
-        ",")
+    required_metadata = frozenset(config["webscraping"]["RequiredMetadataManga"].split(","))
 
-    db_connection_str = os.getenv('DB_ADDRESS')
+    # One collection handle, shared by every db call in this script
+    collection = get_collection("manga", os.getenv('DB_ADDRESS'))
 
     # Loop through each Manga Folder in the Manga Directory
     # Check each metadata file for the required data
     # For each manga that does not have all the required data
     # log to console, go online to find the data, update the metadata file.
     data_dir_manga = config["folders"]["FolderManga"]
-    manga_list = os.listdir(data_dir_manga)
-    incomplete_metadata_set = set()
-    for title in manga_list:
+    thumbnail_dir = config["folders"]["ThumbnailCacheManga"]
+    sort_by_inode = config["folders"].getboolean("SortByInode", fallback=False)
+    titles = [entry.name for entry in scandir_ordered(data_dir_manga, sort_by_inode)
+              if is_valid_manga_title(entry.name) and entry.is_dir()]
 
-        if not is_valid_manga_title(title):
-            continue
+    # Grab the metadata for every title in one query
+    existing_meta_data = load_meta_data_many(collection, titles)
 
-        manga_folder = data_dir_manga+title
+    incomplete_metadata_set = set()
+    pending_meta_data = []
 
-        if not os.path.isdir(manga_folder):
-            continue
+    async def scrape_title(title: str):
+        manga_folder = data_dir_manga+title
 
         # initialize the meta data file
-        meta_data = load_meta_data("manga", title, db_connection_str)
-
-        is_update = len(meta_data) > 0
+        meta_data = existing_meta_data.get(title, {})
 
         # If there are missing parameters go through an acquire them
         missing_params = determine_missing_required_params(meta_data,
                                                            required_metadata)
         if 0 < len(missing_params):
-            print(title)
-            print(f"WARNING! Cache is missing: [{', '.join(missing_params)}].")
+            print(f"{title}\nWARNING! Cache is missing: [{', '.join(missing_params)}].")
 
             # Title is  always the name of the folder the manga is in
             meta_data['title'] = title
 
+            # Track what is still missing as each source fills it in
+            still_missing = set(missing_params)
+            still_missing.discard('title')
+
             # Get the thumbnail, and store the path in the metadata
             # NOTE: This is a true backup. We will attempt to
             #       download thumbnails and overwrite this one.
             # Remove certain characters that shouldnt be in a filename
-            titleClean = re.sub(r"[?\/\\:]", "", title)
-            thumbnail_addr = config["folders"]["ThumbnailCacheManga"] + \
-                titleClean + ".jpg"
-            get_manga_cover_art(manga_folder, thumbnail_addr)
+            titleClean = _TITLE_CLEAN_RE.sub("", title)
+            thumbnail_addr = thumbnail_dir + titleClean + ".jpg"
+            await asyncio.to_thread(get_manga_cover_art, manga_folder, thumbnail_addr)
 
             # Read from MangaUpdates if we have not tried that yet
-            if 'visited_mangaupdates' not in meta_data.keys() or meta_data["visited_mangaupdates"] == False:
-                print("Querying MangaUpdates...")
-                extracted_data = download_manga_updates(title, thumbnail_addr)
-                if extracted_data:
+            if not meta_data.get("visited_mangaupdates"):
+                print(f"Querying MangaUpdates for {title}...")
+                extracted_data = await download_manga_updates(
+                    session, title, thumbnail_addr)
+                # If MangaUpdates couldn't be reached (None), try it again next run
+                if extracted_data is None:
+                    pass
+                elif extracted_data:
                     meta_data.update(extracted_data)
+                    still_missing.difference_update(
+                        key for key, val in extracted_data.items() if val != "")
                 else:
                     meta_data["visited_mangaupdates"] = True
 
             # TODO: Read from MAL or other sources next
 
             # Log if we still don't have enough data after webscraping
-            if 0 < len(determine_missing_required_params(meta_data, required_metadata)):
+            if still_missing:
                 print(
-                    f"WARNING! We are still missing: [{', '.join(missing_params)}].")
+                    f"WARNING! {title} is still missing: [{', '.join(still_missing)}].")
                 incomplete_metadata_set.add(title)
 
-            if "dateAdded" not in meta_data or not meta_data["dateAdded"]:
+            if not meta_data.get("dateAdded"):
                 meta_data["dateAdded"] = datetime.datetime.now()
 
             # Stash the metadata retrieved
-            if is_update:
-                update_meta_data("manga", title, meta_data, db_connection_str)
-            else:
-                meta_data["_id"] = title
-                store_meta_data("manga", meta_data, db_connection_str)
+            pending_meta_data.append((title, meta_data))
+            if _BULK_WRITE_BATCH <= len(pending_meta_data):
+                upsert_meta_data_many(collection, pending_meta_data)
+                pending_meta_data.clear()
+
+    async def process_title(title: str):
+        # One bad title shouldn't take down the rest of the run
+        try:
+            await scrape_title(title)
+        except Exception as e:
+            print(e)
+            print(f"ERROR! Failed to scrape {title}. Skipping.")
+
+    # Titles are scraped concurrently, the per-site limits keep us polite
+    # Whatever was scraped is written back, even if the run is cut short
+    try:
+        await asyncio.gather(*[asyncio.create_task(process_title(title)) for title in titles])
+    finally:
+        upsert_meta_data_many(collection, pending_meta_data)
 
     # Communicate the status
     if incomplete_metadata_set:
         print("Missing data on the following series:\n  - " +
               "\n  - ".join(incomplete_metadata_set))
     else:
-        print(f"All {len(manga_list)} manga metadata files are up to date.")
+        print(f"All {len(titles)} manga metadata files are up to date.")
+
+
+async def main():
+    """Main entry point for the script."""
+    async with make_session() as session:
+        await download_missing_manga_data(session)
 
 
 if __name__ == "__main__":
@@ -201,4 +254,4 @@ if __name__ == "__main__":
         print("DB_ADDRESS was not set; required for this script.")
         exit(1)
 
-    download_missing_manga_data()
+    asyncio.run(main())
@@ -33,15 +33,30 @@
 #                  - Wikipedia
 #
 # ============================================================================ #
+import asyncio
 import datetime
 import os
 import re
-import configparser
 
-from libs.web_scraping import check_for_config_issues, load_meta_data, \
-    determine_missing_required_params, store_meta_data, \
-    update_meta_data, download_my_anime_list, \
-    download_wikipedia, download_imdb
+import aiohttp
+
+from libs.web_scraping import load_config, check_for_config_issues, scandir_ordered, \
+    get_collection, load_meta_data_many, determine_missing_required_params, \
+    upsert_meta_data_many, download_my_anime_list, \
+    download_wikipedia, download_imdb, make_session
+
+# Characters that shouldn't be in a thumbnail's filename
+_TITLE_CLEAN_RE = re.compile(r"[?\/\\:]")
+
+# Metadata is written back to the db in batches of this many titles
+_BULK_WRITE_BATCH = 500
+
+# Sites we scrape, in priority order: (visited flag, name, scraper)
+_SOURCES = [
+    ("visited_mal", "MAL", download_my_anime_list),
+    ("visited_wikipedia", "Wikipedia", download_wikipedia),
+    ("visited_imdb", "IMDB", download_imdb),
+]
 
 
 def is_valid_video_title(title: str) -> bool:
@@ -57,7 +72,26 @@ def is_valid_video_title(title: str) -> bool:
     return not title.startswith("$")
 
 
-def download_missing_video_data():
+def keep_thumbnail(source_thumbnail_addr: str, thumbnail_addr: str, has_thumbnail: bool) -> bool:
+    """Promote a source's thumbnail download to the title's thumbnail,
+    unless a higher priority source already provided one.
+    Either way the source's own copy is cleaned up.
+
+    Returns:
+        bool: True if the title has a thumbnail now.
+    """
+    if not os.path.exists(source_thumbnail_addr):
+        return has_thumbnail
+
+    if has_thumbnail:
+        os.remove(source_thumbnail_addr)
+    else:
+        os.replace(source_thumbnail_addr, thumbnail_addr)
+
+    return True
+
+
+async def download_missing_video_data(session: aiohttp.ClientSession):
     """
         Loop through the video metadata files and verify that 
         the necessary parameters are present.
@@ -65,14 +99,12 @@ def download_missing_video_data():
     """
 
     def update_no_overwrite(dict_dst: dict, dict_src: dict) -> dict:
-        for key, val in dict_src.items():
-            if key not in dict_dst:
-                dict_dst[key] = val
+        # Key views support set ops, so the new keys are found in one C-level pass
+        dict_dst.update({key: dict_src[key] for key in dict_src.keys() - dict_dst.keys()})
         return dict_dst
 
     # Load in the config data
-    config = configparser.ConfigParser()
-    config.read("config.ini")
+    config = load_config("config.ini")
 
     # Ensure that the required parameters are present and
     # defined correctly
@@ -91,102 +123,117 @@ def download_missing_video_data():
         print("Exiting...")
         return
 
-    required_metadata = config["webscraping"]["RequiredMetadataVideo"].split(
-        ",")
+    required_metadata = frozenset(config["webscraping"]["RequiredMetadataVideo"].split(","))
 
-    db_connection_str = os.getenv('DB_ADDRESS')
+    # One collection handle, shared by every db call in this script
+    collection = get_collection("video", os.getenv('DB_ADDRESS'))
 
     # Loop through each Video Folder in the Maga Directory
     # Check each metadata file for the required data
     # For each video that does not have all the required data
     # log to console, go online to find the data, update the metadata file.
     data_dir_video = config["folders"]["FolderVideo"]
-    video_list = os.listdir(data_dir_video)
-    incomplete_metadata_set = set()
-    for title in video_list:
-
-        if not is_valid_video_title(title):
-            continue
+    thumbnail_dir = config["folders"]["ThumbnailCacheVideo"]
+    sort_by_inode = config["folders"].getboolean("SortByInode", fallback=False)
+    titles = [entry.name for entry in scandir_ordered(data_dir_video, sort_by_inode)
+              if is_valid_video_title(entry.name) and entry.is_dir()]
 
-        media_folder = data_dir_video+title
+    # Grab the metadata for every title in one query
+    existing_meta_data = load_meta_data_many(collection, titles)
 
-        if not os.path.isdir(media_folder):
-            continue
+    incomplete_metadata_set = set()
+    pending_meta_data = []
 
+    async def scrape_title(title: str):
         # initialize the meta data file
-        meta_data = load_meta_data("video", title, db_connection_str)
-
-        is_update = len(meta_data) > 0
+        meta_data = existing_meta_data.get(title, {})
 
         # If there are missing parameters go through an aquire them
         missing_params = determine_missing_required_params(meta_data,
                                                            required_metadata)
         if 0 < len(missing_params):
-            print(title)
-            print(f"WARNING! Cache is missing: [{', '.join(missing_params)}].")
+            print(f"{title}\nWARNING! Cache is missing: [{', '.join(missing_params)}].")
 
             # Title is  always the name of the folder the media is in
             meta_data['title'] = title
 
+            # Track what is still missing as each source fills it in
+            still_missing = set(missing_params)
+            still_missing.discard('title')
+
             # Get the thumbnail, and store the path in the metadata
             # NOTE: This is a true backup. We will attempt to
             #       download thumbnails and overwrite this one.
             # Remove certain characters that shouldnt be in a filename
-            titleClean = re.sub(r"[?\/\\:]", "", title)
-            thumbnail_addr = config["folders"]["ThumbnailCacheVideo"] + \
-                titleClean + ".jpg"
-
-            # Read from MAL if we have not tried that yet
-            if 'visited_mal' not in meta_data.keys() or meta_data["visited_mal"] == False:
-                print("Querying MAL...")
-                extracted_data = download_my_anime_list(
-                    title,
-                    None if os.path.exists(thumbnail_addr) else thumbnail_addr)
-                if extracted_data:
-                    meta_data = update_no_overwrite(meta_data, extracted_data)
-                else:
-                    meta_data["visited_mal"] = True
-
-            # Read from MAL if we have not tried that yet
-            if 'visited_wikipedia' not in meta_data.keys() or meta_data["visited_wikipedia"] == False:
-                print("Querying Wikipedia...")
-                extracted_data = download_wikipedia(
-                    title,
-                    None if os.path.exists(thumbnail_addr) else thumbnail_addr)
-                if extracted_data:
-                    meta_data = update_no_overwrite(meta_data, extracted_data)
-                else:
-                    meta_data["visited_wikipedia"] = True
-
-            # Read from MAL if we have not tried that yet
-            if 'visited_imdb' not in meta_data.keys() or meta_data["visited_imdb"] == False:
-                print("Querying IMDB...")
-                extracted_data = download_imdb(
-                    title,
-                    None if os.path.exists(thumbnail_addr) else thumbnail_addr)
-                if extracted_data:
+            titleClean = _TITLE_CLEAN_RE.sub("", title)
+            thumbnail_addr = thumbnail_dir + titleClean + ".jpg"
+
+            # Query every source we have not tried yet at once.
+            # Each source gets its own thumbnail file so they can't clobber each other.
+            has_thumbnail = os.path.exists(thumbnail_addr)
+            queries = [(visited_key, site, None if has_thumbnail else f"{thumbnail_addr}.{visited_key}", download)
+                       for visited_key, site, download in _SOURCES
+                       if not meta_data.get(visited_key)]
+            if queries:
+                print(f"Querying {', '.join(site for _, site, _, _ in queries)} for {title}...")
+            # One source failing shouldn't throw away what the others found
+            results = await asyncio.gather(*[download(session, title, source_thumbnail_addr)
+                                             for _, _, source_thumbnail_addr, download in queries],
+                                           return_exceptions=True)
+
+            # Merge in priority order, the first source's data (and thumbnail) wins
+            # A source that couldn't be reached (None) or failed isn't marked visited,
+            # so it is retried next run
+            for (visited_key, site, source_thumbnail_addr, _), extracted_data in zip(queries, results):
+                if isinstance(extracted_data, BaseException):
+                    if not isinstance(extracted_data, Exception):
+                        raise extracted_data
+                    print(extracted_data)
+                    print(f"ERROR! Failed to scrape {site} for {title}.")
+                elif extracted_data is None:
+                    pass
+                elif extracted_data:
                     meta_data = update_no_overwrite(meta_data, extracted_data)
+                    still_missing.difference_update(
+                        key for key in extracted_data if meta_data[key] != "")
                 else:
-                    meta_data["visited_imdb"] = True
+                    meta_data[visited_key] = True
+
+                if source_thumbnail_addr:
+                    has_thumbnail = keep_thumbnail(source_thumbnail_addr, thumbnail_addr, has_thumbnail)
 
             # TODO: Read from AniDB
 
             # Log if we still don't have enough data after webscraping
-            if 0 < len(determine_missing_required_params(meta_data, required_metadata)):
+            if still_missing:
                 print(
-                    f"WARNING! We are still missing: [{', '.join(missing_params)}].")
+                    f"WARNING! {title} is still missing: [{', '.join(still_missing)}].")
                 incomplete_metadata_set.add(
-                    (title, ",".join(missing_params), os.path.exists(thumbnail_addr)))
+                    (title, ",".join(still_missing), has_thumbnail))
 
-            if "dateAdded" not in meta_data or not meta_data["dateAdded"]:
+            if not meta_data.get("dateAdded"):
                 meta_data["dateAdded"] = datetime.datetime.now()
 
             # Stash the metadata retrieved
-            if is_update:
-                update_meta_data("video", title, meta_data, db_connection_str)
-            else:
-                meta_data["_id"] = title
-                store_meta_data("video", meta_data, db_connection_str)
+            pending_meta_data.append((title, meta_data))
+            if _BULK_WRITE_BATCH <= len(pending_meta_data):
+                upsert_meta_data_many(collection, pending_meta_data)
+                pending_meta_data.clear()
+
+    async def process_title(title: str):
+        # One bad title shouldn't take down the rest of the run
+        try:
+            await scrape_title(title)
+        except Exception as e:
+            print(e)
+            print(f"ERROR! Failed to scrape {title}. Skipping.")
+
+    # Titles are scraped concurrently, the per-site limits keep us polite
+    # Whatever was scraped is written back, even if the run is cut short
+    try:
+        await asyncio.gather(*[asyncio.create_task(process_title(title)) for title in titles])
+    finally:
+        upsert_meta_data_many(collection, pending_meta_data)
 
     # Communicate the status
     # NOTE: We package a lot of info in a tuple, and sort the titles before
@@ -202,7 +249,13 @@ def download_missing_video_data():
             for param in missing_params.split(","):
                 print(f"     - {param}")
     else:
-        print(f"All {len(video_list)} video metadata files are up to date.")
+        print(f"All {len(titles)} video metadata files are up to date.")
+
+
+async def main():
+    """Main entry point for the script."""
+    async with make_session() as session:
+        await download_missing_video_data(session)
 
 
 if __name__ == "__main__":
@@ -210,4 +263,4 @@ if __name__ == "__main__":
         print("DB_ADDRESS was not set; required for this script.")
         exit(1)
 
-    download_missing_video_data()
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+import pytest
+
+from libs.web_scraping import extract_year
+
+
+@pytest.mark.parametrize("text", [
+    "April 3, 1998",
+    "April 3 1998",
+    "3 April 1998",
+])
+def test_extract_year_formats(text):
+    assert extract_year(text) == "1998"
+
+
+def test_extract_year_no_date():
+    assert extract_year("TBA") is None
+
+
+def test_extract_year_leftmost_date_wins():
+    # The first date in the string wins, whatever its format
+    assert extract_year("3 April 1998 (Japan) April 5, 1999 (United States)") == "1998"
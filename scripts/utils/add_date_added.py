@@ -10,15 +10,32 @@ import pymongo
 manga_folder = "manga/"
 video_folder = "videos/"
 
+# Walk the folders in inode order, cuts down on seeks for spinning disks
+sort_by_inode = False
 
-def add_dateAdded(media_folder: str, collection: pymongo.MongoClient):
-    for title in os.listdir(media_folder):
-        title_dir_path = f"{media_folder}{title}"
-        dateAdded = datetime.datetime.fromtimestamp(
-            os.path.getmtime(title_dir_path))
+# Updates are sent to the db in batches of this many titles
+_BULK_WRITE_BATCH = 500
 
-        collection.update_one(
-            {"_id": title}, {"$set": {"dateAdded": dateAdded}})
+
+def add_dateAdded(media_folder: str, collection: pymongo.collection.Collection):
+    with os.scandir(media_folder) as it_titles:
+        entries = list(it_titles)
+    if sort_by_inode:
+        entries.sort(key=lambda entry: entry.inode())
+
+    ops = []
+    for entry in entries:
+        dateAdded = datetime.datetime.fromtimestamp(entry.stat().st_mtime)
+
+        ops.append(pymongo.UpdateOne(
+            {"_id": entry.name}, {"$set": {"dateAdded": dateAdded}}))
+
+        if len(ops) >= _BULK_WRITE_BATCH:
+            collection.bulk_write(ops, ordered=False)
+            ops = []
+
+    if ops:
+        collection.bulk_write(ops, ordered=False)
 
 
 def main():
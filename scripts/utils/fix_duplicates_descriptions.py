@@ -10,19 +10,21 @@ def main():
     db_metadata = db["mediaMetadata"]
     collection = db_metadata["video"]
 
-    docs = collection.find({})
-
-    for doc in docs:
-        title = doc['_id']
-        if "description" not in doc:
-            print(f"Missing description in doc {title}")
-            continue
-        desc = doc["description"]
-
-        len_third = int(len(desc)/3)
-        if desc[:len_third] == desc[len_third:len_third*2]:
-            collection.update_one(
-                {"_id": title}, {"$set": {"description": desc[:len_third]}})
+    for doc in collection.find({"description": {"$exists": False}}, projection={"_id": 1}):
+        print(f"Missing description in doc {doc['_id']}")
+
+    # If the first third of the description is repeated in the second third,
+    # cut it down to just the first third. Done entirely on the server.
+    first_third = {"$substrCP": ["$description", 0, "$$len_third"]}
+    second_third = {"$substrCP": ["$description", "$$len_third", "$$len_third"]}
+    # Safe to re-run if anything is lost, so skip waiting on the journal
+    result = collection.with_options(write_concern=pymongo.WriteConcern(w=1, j=False)).update_many(
+        {"description": {"$type": "string"}},
+        [{"$set": {"description": {"$let": {
+            "vars": {"len_third": {"$toInt": {"$floor": {"$divide": [{"$strLenCP": "$description"}, 3]}}}},
+            "in": {"$cond": [{"$eq": [first_third, second_third]}, first_third, "$description"]}
+        }}}}])
+    print(f"Fixed {result.modified_count} duplicate descriptions.")
 
     return
 
@@ -3,8 +3,8 @@
 # design, into mongodb.
 # ============================================================================ #
 import os
-import configparser
 import pymongo
+from concurrent.futures import ThreadPoolExecutor
 
 
 manga_folder = "manga/"
@@ -12,67 +12,106 @@ video_folder = "videos/"
 # image_folder = "~/seastorage-V/images/"
 # music_folder = "~/seastorage-V/music/"
 
-def as_bool(s):
-    return True if s == "True" else False
+# Walk the folders in inode order, cuts down on seeks for spinning disks
+sort_by_inode = False
 
-def db_get_manga(title : str):
-    pass
-
-def migrate_manga(cparser : configparser.ConfigParser, collection : pymongo.MongoClient):
-    for title in os.listdir(manga_folder):
-        metadata_filepath = f"{manga_folder}{title}/info.meta"
+# Reading the metadata files is latency bound, so read several at once
+_MAX_WORKERS = 16
 
-        # Skip this migration if there is no data for this media, or
-        # data has already been migrated
-        if not os.path.exists(metadata_filepath): continue
-        test = collection.find_one({"_id": title})
-        if test: continue
-        
+# Stringly-typed bools in the flat files
+_BOOLS = {"True": True, "False": False}
 
-        cparser.read(metadata_filepath)
-        metadata = {key : val if val not in ["True", "False"] else as_bool(val) for key, val in cparser["DEFAULT"].items()}
-        metadata["_id"] = title
-        metadata["tags"] = metadata["tags"].split(", ")
-        if "iconaddr" in metadata: metadata.pop("iconaddr")
-        if "iconAddr" in metadata: metadata.pop("iconAddr")
-
-        print(f"Inserting \"{title}\"...")
+def db_get_manga(title : str):
+    pass
 
-        collection.insert_one(metadata)
+def parse_meta(metadata_filepath : str) -> dict:
+    # info.meta is just flat "key = value" lines, with or without a [DEFAULT] header.
+    # Keys are lowercased to match what ConfigParser used to give us
+    metadata = {}
+    with open(metadata_filepath) as fp_in:
+        for line in fp_in:
+            if line.startswith(("[", ";", "#")) or "=" not in line: continue
+            key, _, val = line.partition("=")
+            metadata[key.strip().lower()] = val.strip()
+    return metadata
+
+def parse_manga(entry : os.DirEntry) -> dict | None:
+    title = entry.name
+    metadata_filepath = f"{entry.path}/info.meta"
+
+    # Skip this migration if there is no data for this media
+    # (opening the file is the existence check, no separate stat)
+    try:
+        metadata = parse_meta(metadata_filepath)
+    except FileNotFoundError:
+        return None
+
+    metadata = {key : _BOOLS.get(val, val) for key, val in metadata.items()}
+    metadata["_id"] = title
+    metadata["tags"] = [tag.strip() for tag in metadata["tags"].split(",")]
+    metadata.pop("iconaddr", None)
+    metadata.pop("iconAddr", None)
+
+    return metadata
+
+def parse_video(entry : os.DirEntry) -> dict | None:
+    title = entry.name
+    metadata_filepath = f"{entry.path}/info.meta"
+
+    # Skip this migration if there is no data for this media
+    # (opening the file is the existence check, no separate stat)
+    # NOTE videos "use"(still had) an old format, without the [DEFAULT] header
+    try:
+        metadata = parse_meta(metadata_filepath)
+    except FileNotFoundError:
+        return None
+
+    metadata = {key : _BOOLS.get(val, val) for key, val in metadata.items()}
+    metadata["_id"] = title
+    metadata["title"] = title
+    metadata["tags"] = [tag.strip() for tag in metadata["tags"].split(",")]
+    metadata.pop("iconaddr", None)
+    metadata.pop("iconAddr", None)
+
+    return metadata
+
+def migrate_titles(folder : str, parse, collection : pymongo.collection.Collection):
+    # Titles are folders, is_dir comes straight from the dirent
+    with os.scandir(folder) as it_titles:
+        entries = [entry for entry in it_titles if entry.is_dir(follow_symlinks=False)]
+    if sort_by_inode:
+        entries.sort(key=lambda entry: entry.inode())
+
+    # Skip anything that has already been migrated, checked in one query
+    titles = [entry.name for entry in entries]
+    migrated = set(collection.distinct("_id", {"_id": {"$in": titles}}))
+    entries = [entry for entry in entries if entry.name not in migrated]
+
+    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+        parsed = [metadata for metadata in executor.map(parse, entries) if metadata]
+
+    for metadata in parsed:
+        print(f"Inserting \"{metadata['_id']}\"...")
+
+    # This is a one-off initial load that can just be re-run (already migrated titles
+    # are skipped), so don't wait for any acknowledgement
+    if parsed:
+        collection.with_options(write_concern=pymongo.WriteConcern(w=0)).bulk_write(
+            [pymongo.InsertOne(metadata) for metadata in parsed], ordered=False)
+
+def migrate_manga(collection : pymongo.collection.Collection):
+    migrate_titles(manga_folder, parse_manga, collection)
             
-def migrate_videos(cparser : configparser.ConfigParser, collection : pymongo.MongoClient):
-    for title in os.listdir(video_folder):
-        metadata_filepath = f"{video_folder}{title}/info.meta"
-
-        # Skip this migration if there is no data for this media, or
-        # data has already been migrated
-        if not os.path.exists(metadata_filepath): continue
-        test = collection.find_one({"_id": title})
-        if test: continue
-        
-        # NOTE videos "use"(still had) an old format
-        with open(metadata_filepath) as fp_in:
-            cparser.read_string("[DEFAULT]\n" + fp_in.read())
-
-        metadata = {key : val if val not in ["True", "False"] else as_bool(val) for key, val in cparser["DEFAULT"].items()}
-        metadata["_id"] = title
-        metadata["title"] = title
-        metadata["tags"] = metadata["tags"].split(", ")
-        if "iconaddr" in metadata: metadata.pop("iconaddr")
-        if "iconAddr" in metadata: metadata.pop("iconAddr")
-
-        print(f"Inserting \"{title}\"...")
-
-        collection.insert_one(metadata)
+def migrate_videos(collection : pymongo.collection.Collection):
+    migrate_titles(video_folder, parse_video, collection)
 
 
 def main():
-    cparser = configparser.ConfigParser()
     db = pymongo.MongoClient("mongodb://localhost:27017/")
     db_metadata = db["mediaMetadata"]
 
-    migrate_manga(cparser, db_metadata["manga"])
-    migrate_videos(cparser, db_metadata["video"])
+    migrate_manga(db_metadata["manga"])
+    migrate_videos(db_metadata["video"])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file